@@ -6,6 +6,9 @@ import os
 import pandas as pd
 
 from utils import get_google_creds
+from kitDataMerger.meteorology.get_weather import WEATHER_COLUMNS
+from kitDataMerger.sample_name import parse_merged_name
+from kitDataMerger.storage import PUBLIC_CSV_OPTIONS, as_read_back, read_frame
 
 # Get credentials from the .env file
 creds = get_google_creds()
@@ -40,7 +43,9 @@ def _parse_cords(raw_cords):
     return None
 
 
-def _save_docs(progress_var, percentage_label, num_files, index_name):
+def _save_docs(
+    progress_var, percentage_label, num_files, index_name, kits=None, frames=None
+):
     """
     Save documents from CSV files to Google Storage index.
 
@@ -49,6 +54,9 @@ def _save_docs(progress_var, percentage_label, num_files, index_name):
     - percentage_label: Tkinter label for displaying progress percentage.
     - num_files: Total number of CSV files to process.
     - index_name: Name of the Google Storage index.
+    - kits: Ids of the kits to save, all the kits are saved if not provided.
+    - frames: Dictionary mapping the public filename of each kit to its DataFrame.
+        If provided, the kits are saved from it instead of "./kitDataMerger/microbiome-public".
 
     Returns:
     None
@@ -56,11 +64,24 @@ def _save_docs(progress_var, percentage_label, num_files, index_name):
     progress_counter = 0
     progress_var.set(0)
     percentage_label.configure(text=(("%.2f " % 0) + "%"))
-    for file in os.listdir(f"./kitDataMerger/microbiome-public"):
-        # read the csv file
-        df = pd.read_csv(
-            f"./kitDataMerger/microbiome-public/{file}", encoding="utf-16", sep="\t"
-        )
+    files = (
+        frames.keys()
+        if frames is not None
+        else os.listdir(f"./kitDataMerger/microbiome-public")
+    )
+    for file in files:
+        # Skip the kits that were not merged again
+        if kits is not None and parse_merged_name(file) not in kits:
+            continue
+
+        # read the csv file, unless the kit is already in memory (it then gets the column
+        # types it would have been read with, so the same types are uploaded)
+        if frames is not None:
+            df = as_read_back(frames[file], PUBLIC_CSV_OPTIONS, WEATHER_COLUMNS)
+        else:
+            df = read_frame(
+                f"./kitDataMerger/microbiome-public/{file}", PUBLIC_CSV_OPTIONS
+            )
         records = df.to_dict(orient="records")
         for rec in records:
             for key, value in rec.items():
@@ -92,7 +113,13 @@ def _save_docs(progress_var, percentage_label, num_files, index_name):
 
 
 def fetch_and_index_data(
-    progress_var, percentage_label, status_label, num_files, index_name="microbiome"
+    progress_var,
+    percentage_label,
+    status_label,
+    num_files,
+    index_name="microbiome",
+    kits=None,
+    frames=None,
 ):
     """
     Fetches data from CSV files and indexes it into Google Storage.
@@ -103,6 +130,9 @@ def fetch_and_index_data(
     - status_label: Tkinter label for displaying status messages.
     - num_files: Total number of CSV files to process.
     - index_name: Name of the Google Storage index (default is "microbiome").
+    - kits: Ids of the kits to save, all the kits are saved if not provided.
+    - frames: Dictionary mapping the public filename of each kit to its DataFrame,
+        the kits are read from "./kitDataMerger/microbiome-public" if not provided.
 
     Returns:
     None
@@ -115,4 +145,6 @@ def fetch_and_index_data(
         percentage_label=percentage_label,
         num_files=num_files,
         index_name=index_name,
+        kits=kits,
+        frames=frames,
     )
@@ -0,0 +1,78 @@
+"""
+Microbenchmark of the sample filename parsing: the inline re.match and re.search calls the
+manifest scan used to make for every file, against the shared parse_sample_name.
+
+Run from the project directory:
+    python -m benchmarks.bench_sample_name
+"""
+import re
+import random
+import timeit
+
+from kitDataMerger.sample_name import normalize_sample_name, parse_sample_name
+
+# Number of synthetic filenames, and number of timed runs (the best one is reported)
+FILES = 100_000
+REPEAT = 5
+
+
+def make_filenames(count, seed=0):
+    """
+    Make synthetic filenames, mostly sample files and some other files of a data directory.
+
+    Parameters:
+    - count: Number of filenames.
+    - seed: Seed of the random generator.
+
+    Returns:
+    List of the filenames.
+    """
+    rnd = random.Random(seed)
+    filenames = []
+    for _ in range(count):
+        if rnd.random() < 0.9:
+            sample = rnd.choice(["F", "R", "S", "Fr", "L", "f", "fr"])
+            suffix = rnd.choice(["", "_2023", "_rep2"])
+            filenames.append(f"S{rnd.randint(1, 5000)}_{sample}{suffix}.csv")
+        else:
+            filenames.append(rnd.choice(["README.txt", "S_12_Fungi.csv", "notes.csv"]))
+    return filenames
+
+
+def inline(filenames):
+    # The manifest scan before the shared parser
+    samples = []
+    for filename in filenames:
+        if not re.match(r"^S(\d+)_(Fr|R|S|F|L)(.*)", filename):
+            continue
+        name = filename.upper() if not "Fr" in filename else filename
+        match = re.search(r"^S(\d+)_(Fr|R|S|F|L)(.*)", name.split(".")[0])
+        if not match:
+            continue
+        samples.append((name, match.group(1), match.group(2)))
+    return samples
+
+
+def shared(filenames):
+    samples = []
+    for filename in filenames:
+        parsed = parse_sample_name(filename)
+        if parsed is None:
+            continue
+        samples.append(
+            (normalize_sample_name(filename), parsed.kit_id, parsed.sample)
+        )
+    return samples
+
+
+def main():
+    filenames = make_filenames(FILES)
+    for function in (inline, shared):
+        seconds = min(
+            timeit.repeat(lambda: function(filenames), number=1, repeat=REPEAT)
+        )
+        print(f"{function.__name__}: {seconds:.3f} s for {FILES} filenames")
+
+
+if __name__ == "__main__":
+    main()
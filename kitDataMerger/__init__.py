@@ -2,6 +2,11 @@ __all__ = [
     "fungi",
     "data_filter",
     "file_merger",
+    "manifest",
     "meta_data_merger",
-    "meteorology"
+    "meteorology",
+    "pipeline",
+    "progress",
+    "sample_name",
+    "storage",
 ]
\ No newline at end of file
@@ -0,0 +1,259 @@
+import os
+import sys
+
+import shutil
+import logging
+import argparse
+import multiprocessing
+
+# The stages work in "./kitDataMerger", so the project directory must be the work directory
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+from kitDataMerger.incremental import plan_incremental, save_state
+from kitDataMerger.manifest import scan_samples
+from kitDataMerger.pipeline import Pipeline
+from kitDataMerger.meteorology.get_weather import FETCH_WORKERS, IMSProvider
+from kitDataMerger.meteorology.providers import RecordingProvider, ReplayProvider
+from kitDataMerger.progress import JsonLinesReporter, TextReporter
+from kitDataMerger.storage import FORMATS
+from kitDataMerger.fungi.update_fungi_ids import update_fungi_ids
+
+# The progress reporters that can be chosen with --progress
+REPORTERS = {"text": TextReporter, "jsonl": JsonLinesReporter}
+
+
+def parse_args(argv=None):
+    """
+    Parse the command line arguments.
+
+    Parameters:
+    - argv: List of arguments, sys.argv is used if not provided.
+
+    Returns:
+    argparse.Namespace of the arguments.
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m kitDataMerger",
+        description="Merge, enrich and upload the microbiome samples without the GUI.",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser(
+        "run", help="Run the full upload pipeline (filter, merge, weather, metadata)."
+    )
+    run_parser.add_argument(
+        "--type", required=True, choices=["Fungi", "Bacteria"], help="Samples type."
+    )
+    run_parser.add_argument(
+        "--data",
+        required=True,
+        help="Directory of the samples (for fungi, a directory of seq folders).",
+    )
+    run_parser.add_argument("--meta", required=True, help="Path of the metadata file.")
+    run_parser.add_argument(
+        "--out",
+        required=True,
+        help='Directory to save the "microbiome-output" directory to.',
+    )
+    run_parser.add_argument(
+        "--upload", action="store_true", help="Upload the public data to the database."
+    )
+    run_parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only process the kits that changed since the last incremental run.",
+    )
+    run_parser.add_argument(
+        "--format",
+        choices=FORMATS,
+        default="csv",
+        help="File format of the checkpoints kept by an incremental run.",
+    )
+    run_parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of worker processes used to find the fungi ids and parse the files.",
+    )
+    run_parser.add_argument(
+        "--fetch-workers",
+        type=int,
+        default=FETCH_WORKERS,
+        help="Maximum number of weather stations whose data is fetched at the same time.",
+    )
+    weather = run_parser.add_mutually_exclusive_group()
+    weather.add_argument(
+        "--weather-archive",
+        help="Directory of a recorded weather archive, to get the weather from instead of the IMS.",
+    )
+    weather.add_argument(
+        "--record-weather",
+        help="Directory to record the weather from the IMS to, for later runs with --weather-archive.",
+    )
+    run_parser.add_argument(
+        "--progress",
+        choices=list(REPORTERS),
+        default="text",
+        help='Progress output, "text" lines on stderr or "jsonl" events on stdout.',
+    )
+    return parser.parse_args(argv)
+
+
+def run(args, reporter):
+    """
+    Run the full upload pipeline, like the "Upload Samples" tab.
+
+    Parameters:
+    - args: argparse.Namespace of the "run" command.
+    - reporter: ProgressReporter of the run.
+
+    Returns:
+    Exit code of the run, 0 if the output was saved.
+    """
+    progress_var = reporter.progress_var
+    percentage_label = reporter.percentage_label
+    status_label = reporter.status_label
+
+    output_dir = os.path.join(args.out, "microbiome-output")
+    if os.path.exists(output_dir):
+        reporter.error(
+            "Cannot save the data",
+            f"There is already merged data in {output_dir}, please delete/move it or choose a different directory.",
+        )
+        return 1
+
+    # If the upload type is Fungi, the program will also search for ids of the Fungis
+    if args.type == "Fungi":
+        status_label.configure(text="Geting Fungi Ids")
+        try:
+            update_fungi_ids(
+                args.data, progress_var, percentage_label, workers=args.workers
+            )
+        except FileNotFoundError as e:
+            logging.error(f"Could not get the fungi ids: {e}")
+            return 1
+
+    # Scan the data directory once, every stage uses the manifest of its sample files
+    data_dir = (
+        args.data
+        if args.type != "Fungi"
+        else "./kitDataMerger/fungi/data/microbiome-public"
+    )
+    manifest = scan_samples(data_dir, args.type)
+
+    # Only the kits whose files or metadata changed since the last run are processed again
+    kits = None
+    if args.incremental:
+        kits, incremental_state = plan_incremental(
+            manifest, args.meta, args.type, args.format
+        )
+
+    if not manifest and kits is None:
+        reporter.error("There was a problem", f"No sample files were found in {data_dir}.")
+        return 1
+
+    # The weather comes from the IMS, unless a recorded archive is replayed
+    weather_provider = None
+    if args.weather_archive is not None:
+        try:
+            weather_provider = ReplayProvider(args.weather_archive)
+        except FileNotFoundError as e:
+            reporter.error("There was a problem", str(e))
+            return 1
+    elif args.record_weather is not None:
+        weather_provider = RecordingProvider(IMSProvider(), args.record_weather)
+
+    # Filter, merge and add the meta data in memory
+    pipeline = Pipeline(
+        data_dir,
+        args.meta,
+        args.type,
+        progress_var,
+        percentage_label,
+        status_label,
+        workers=args.workers,
+        checkpoints=("merged", "public") if args.incremental else (),
+        kits=kits,
+        file_format=args.format,
+        fetch_workers=args.fetch_workers,
+        weather_provider=weather_provider,
+    )
+    if not pipeline.run(
+        manifest=manifest, weather_status_label=reporter.sub_status_label
+    ):
+        return 1
+
+    # Uploading of the data if the user chose to upload it
+    if args.upload:
+        # The database connection needs the credentials, so it is only imported when uploading
+        from GCP.connect_GCP import fetch_and_index_data
+
+        fetch_and_index_data(
+            progress_var,
+            percentage_label,
+            status_label,
+            len(pipeline.public),
+            index_name="microbiome",
+            kits=kits,
+            frames=pipeline.public,
+        )
+
+    # Remember the processed files, so the next incremental run can skip them
+    if args.incremental:
+        save_state(args.type, incremental_state)
+
+    # Save the public data, and the private data (lab data) of the fungi
+    status_label.configure(text="Saving data...")
+    os.makedirs(os.path.join(output_dir, "microbiome-public-data"))
+    pipeline.export(os.path.join(output_dir, "microbiome-public-data"))
+    if args.type == "Fungi":
+        os.makedirs(os.path.join(output_dir, "microbiome-private-data"))
+        for seq_folder in os.listdir(f"./kitDataMerger/fungi/data/microbiome-private"):
+            for filename in os.listdir(
+                f"./kitDataMerger/fungi/data/microbiome-private/{seq_folder}"
+            ):
+                shutil.copy2(
+                    f"./kitDataMerger/fungi/data/microbiome-private/{seq_folder}/{filename}",
+                    os.path.join(output_dir, "microbiome-private-data", filename),
+                )
+        shutil.rmtree(f"./kitDataMerger/fungi/data")
+
+    status_label.configure(text="All files has been generated!")
+    return 0
+
+
+def main(argv=None):
+    """
+    Run the command line interface.
+
+    Parameters:
+    - argv: List of arguments, sys.argv is used if not provided.
+
+    Returns:
+    Exit code of the command.
+    """
+    args = parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s | %(levelname)s | %(message)s",
+        datefmt="%d/%m/%Y %I:%M:%S %p",
+    )
+
+    # The paths are resolved before changing the work directory to the project directory
+    args.data = os.path.abspath(args.data)
+    args.meta = os.path.abspath(args.meta)
+    args.out = os.path.abspath(args.out)
+    for name in ("weather_archive", "record_weather"):
+        if getattr(args, name) is not None:
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+    os.chdir(PROJECT_DIR)
+
+    return run(args, REPORTERS[args.progress]())
+
+
+if __name__ == "__main__":
+    # Needed by the worker processes on platforms that spawn them
+    multiprocessing.freeze_support()
+    sys.exit(main())
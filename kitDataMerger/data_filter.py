@@ -1,7 +1,10 @@
 import os
 
-import re
 import shutil
+import logging
+
+from .manifest import scan_samples
+
 
 def filter(
     data_dir,
@@ -9,7 +12,28 @@ def filter(
     percentage_label,
     status_label,
     sample_type,
+    staging="copy",
+    manifest=None,
+    kits=None,
 ):
+    """
+    Select the sample files of the data directory for the merge.
+
+    Parameters:
+    - data_dir: Directory of the samples (for fungi, a directory of seq folders).
+    - progress_var: Tkinter variable for tracking progress.
+    - percentage_label: Tkinter label for displaying progress percentage.
+    - status_label: Tkinter label for displaying status messages.
+    - sample_type: "Fungi" or "Bacteria".
+    - staging: How the selected files are staged in "./kitDataMerger/filtered_data":
+        "copy" copies them, "link" hardlinks (or symlinks) them, and "manifest" does not
+        stage them at all, so the merge reads them straight from the data directory.
+    - manifest: The sample files of the data directory, if it was already scanned.
+    - kits: Ids of the kits to select, all the kits are selected if not provided.
+
+    Returns:
+    List of SampleFile entries of the selected files, with the path they should be read from.
+    """
     # If the destination direcorty already exists, delete it
     if os.path.exists(f"./kitDataMerger/filtered_data"):
         shutil.rmtree(f"./kitDataMerger/filtered_data")
@@ -20,48 +44,79 @@ def filter(
     # Set the progress bar text label
     status_label.configure(text="Filtering data...")
 
-    os.makedirs(f"./kitDataMerger/filtered_data")
-    if sample_type == "Bacteria":
-        # Count how many files to be filtered are there
-        num_files = sum([1 for _ in os.listdir(data_dir)])
-        # Copy files that match the creteria (Starts with "S")
-        for filename in os.listdir(data_dir):
-            if re.match(r"^S(\d+)_(Fr|R|S|F|L)(.*)", filename):
-                with open(f"./kitDataMerger/filtered_data/{filename}", "w") as f:
-                    shutil.copy2(
-                        f"{data_dir}/{filename}",
-                        f'./kitDataMerger/filtered_data/{filename.upper() if not "Fr" in filename else filename}',
-                    )
-
-            progress_counter += 1
-            progress = progress_counter / num_files
-            progress_var.set(progress)
-            percentage_label.configure(text=(("%.2f " % (progress * 100)) + "%"))
-
-    elif sample_type == "Fungi":
-        num_files = 0
-        # Count how many files to be filtered are there
-        for seq_folder in os.listdir(data_dir):
-            for filename in os.listdir(
-                f"./kitDataMerger/fungi/data/microbiome-public/{seq_folder}"
-            ):
-                num_files += 1
-        # Copy files that match the creteria (files that starts with "S")
-        for seq_folder in os.listdir(data_dir):
-            for filename in os.listdir(
-                f"./kitDataMerger/fungi/data/microbiome-public/{seq_folder}"
-            ):
-                if re.match(r"^S(\d+)_(Fr|R|S|F|L)(.*)", filename):
-                    filename = f"{'.'.join((filename.upper() if not 'Fr' in filename else filename).split('.')[:-1])}.csv"
-                    with open(f"./kitDataMerger/filtered_data/{filename}", "w") as f:
-                        shutil.copy2(
-                            f"./kitDataMerger/fungi/data/microbiome-public/{seq_folder}/{filename}",
-                            f"./kitDataMerger/filtered_data/{filename}",
-                        )
-
-                progress_counter += 1
-                progress = progress_counter / num_files
-                progress_var.set(progress)
-                percentage_label.configure(text=(("%.2f " % (progress * 100)) + "%"))
-
-    return True  # As a success
+    if staging != "manifest":
+        os.makedirs(f"./kitDataMerger/filtered_data")
+
+    # Scan the data directory once for the files that match the creteria (Starts with "S")
+    if manifest is None:
+        manifest = scan_samples(data_dir, sample_type)
+
+    # Skip the kits that do not need to be merged again
+    if kits is not None:
+        manifest = [sample_file for sample_file in manifest if sample_file.kit_id in kits]
+
+    # A sample found in several seq folders is only taken once, from the last folder it was
+    # found in, like staging it in the filtered data directory replaces the earlier copies
+    last_positions = {
+        sample_file.name: position for position, sample_file in enumerate(manifest)
+    }
+    for position, sample_file in enumerate(manifest):
+        if last_positions[sample_file.name] != position:
+            logging.warning(
+                f"{sample_file.name} was found more than once, {sample_file.path} is replaced by "
+                f"{manifest[last_positions[sample_file.name]].path}"
+            )
+    manifest = [
+        sample_file
+        for position, sample_file in enumerate(manifest)
+        if last_positions[sample_file.name] == position
+    ]
+
+    num_files = len(manifest)
+    filtered = []
+    for sample_file in manifest:
+        filtered.append(
+            sample_file._replace(
+                path=_stage_file(sample_file.path, sample_file.name, staging)
+            )
+        )
+
+        progress_counter += 1
+        progress = progress_counter / num_files
+        progress_var.set(progress)
+        percentage_label.configure(text=(("%.2f " % (progress * 100)) + "%"))
+
+    return filtered
+
+
+def _stage_file(source, filtered_filename, staging):
+    """
+    Stage a selected file in the filtered data directory.
+
+    Parameters:
+    - source: Path of the selected file.
+    - filtered_filename: Name of the file in the filtered data directory.
+    - staging: "copy", "link" or "manifest" (see filter).
+
+    Returns:
+    The path the merge should read the file from.
+    """
+    if staging == "manifest":
+        return source
+
+    destination = f"./kitDataMerger/filtered_data/{filtered_filename}"
+    if staging == "link":
+        # Prefer a hardlink, fall back to a symlink (e.g. across drives), and copy as a last resort
+        try:
+            os.link(source, destination)
+            return destination
+        except OSError:
+            pass
+        try:
+            os.symlink(os.path.abspath(source), destination)
+            return destination
+        except OSError:
+            pass
+
+    shutil.copy2(source, destination)
+    return destination
@@ -1,101 +1,135 @@
 import os
 
-import re
 import shutil
-import tkinter as tk
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
+import numpy as np
 import pandas as pd
 
+from .manifest import scan_directory
+from .sample_name import Sample
+from .storage import (
+    MERGED_CSV_OPTIONS,
+    check_format,
+    clear_kit_files,
+    kit_filename,
+    run_tasks,
+    write_frame,
+)
+
+SAMPLES = [sample.value for sample in Sample]
+TAXONOMY_LEVELS = ["Kingdom", "Philum", "Class", "Order", "Family", "Genus", "Species"]
+
 
 def merge_data(
     progress_var,
     percentage_label,
     status_label,
     samples_type,
+    workers=1,
+    manifest=None,
+    kits=None,
+    file_format="csv",
 ):
-    # If the destination directory already exists, delete it
-    if os.path.exists(f"./kitDataMerger/merged_asv_data"):
-        shutil.rmtree(f"./kitDataMerger/merged_asv_data")
+    check_format(file_format)
+
+    # Remove the previous outputs of the kits that are merged again (all the kits if kits is
+    # not provided), the outputs of the other samples type are kept
+    clear_kit_files(f"./kitDataMerger/merged_asv_data", samples_type, kits)
+
+    merged = _merge_samples(
+        progress_var, percentage_label, status_label, samples_type, workers, manifest
+    )
+    return _save_to_csv(merged, samples_type, workers, file_format)
+
 
+def merge_frames(
+    progress_var,
+    percentage_label,
+    status_label,
+    samples_type,
+    workers=1,
+    manifest=None,
+):
+    """
+    Merge the filtered files in memory, without writing the merged data directory.
+
+    Parameters:
+    - progress_var: Tkinter variable for tracking progress.
+    - percentage_label: Tkinter label for displaying progress percentage.
+    - status_label: Tkinter label for displaying status messages.
+    - samples_type: "Fungi" or "Bacteria".
+    - workers: Number of worker processes used to parse the files and format the kits.
+    - manifest: List of SampleFile entries of the filtered files, the filtered data directory
+        is scanned if not provided.
+
+    Returns:
+    Dictionary mapping the merged filename of each kit (S_{kit}_{type}.csv) to its formatted DataFrame.
+    A kit that could not be formatted is logged and left out.
+    """
+    merged = _merge_samples(
+        progress_var, percentage_label, status_label, samples_type, workers, manifest
+    )
+
+    # Format the kits in a process pool if there is more than one worker
+    formatted, errors = run_tasks(
+        _format_kit,
+        {
+            kit: (kit, kit_df.droplevel("kit_id"), samples_type)
+            for kit, kit_df in merged.groupby(level="kit_id", sort=False)
+        },
+        workers,
+    )
+    for kit, e in errors.items():
+        logging.error(f"Could not format the merged data of kit ID {kit}: {e}")
+    return {
+        kit_filename(kit, samples_type): kit_df for kit, kit_df in formatted.items()
+    }
+
+
+def _merge_samples(
+    progress_var, percentage_label, status_label, samples_type, workers, manifest
+):
+    """
+    Parse the filtered files and pivot them into the merged data.
+
+    Parameters:
+    - progress_var: Tkinter variable for tracking progress.
+    - percentage_label: Tkinter label for displaying progress percentage.
+    - status_label: Tkinter label for displaying status messages.
+    - samples_type: "Fungi" or "Bacteria".
+    - workers: Number of worker processes used to parse the files.
+    - manifest: List of SampleFile entries of the filtered files, or None to scan the filtered data directory.
+
+    Returns:
+    Pandas DataFrame indexed by (kit_id, taxon) with a column for each sample category.
+    """
     # Initialise a merged-file counter to track progress
     progress_counter = 0
 
+    # Use the files selected by the filter, or scan the filtered data directory
+    if manifest is None:
+        manifest = scan_directory("./kitDataMerger/filtered_data")
+
     # Count how many files to be merged are there
-    num_files = sum([1 for _ in os.listdir("./kitDataMerger/filtered_data")])
+    num_files = len(manifest)
 
     # Set the progress bar text label
     status_label.configure(text="Merging data...")
 
-    # For each and every filtered data directory, create a twin directory in the destination directory
-    os.makedirs(f"./kitDataMerger/merged_asv_data")
-
-    # Create a dictionary that will hold the merged data in the future, in the following format:
-    # {
-    #   kit_id: {
-    #       "bacteria/fungi_id;taxonomy": {
-    #           'F': f_prob,
-    #           'R': r_prob,
-    #           'Fr': fr_prob,
-    #           'S': s_prob,
-    #           'L': l_prob
-    #       }
-    #   }
-    # }
-
-    mdata = {}
-    counter_files = 0
-
-    # Iterate through all the filtered files
-    for filename in os.listdir(f"./kitDataMerger/filtered_data"):
-
-        counter_files += 1
-
-        # Clean filename from extension and irrelevent info
-        clean_filename = filename.split(".")[0]
-
-        # Use a RegEx pattern to split the clean filename into two groups - kit id and sample category (F, R, Fr, S, L)
-        match = re.search(r"^S(\d+)_(Fr|R|S|F|L)(.*)", clean_filename)
-
-        # In case of a split error, count the file as "merged" and continue to the next one
-        if not match:
-            progress_counter += 1
-            progress = progress_counter / num_files
-            progress_var.set(progress)
-            percentage_label.configure(text=(("%.2f " % (progress * 100)) + "%"))
-            continue
-
-        # Get the kit id and sample type from the RegEx search
-        kit_id = match.group(1)
-        sample = match.group(2)
-        sample = sample.upper() if sample != "Fr" else sample
-
-        # Use Pandas to read the filtered data
-        df = pd.read_csv(f"./kitDataMerger/filtered_data/{filename}")
-
-        # Format the data into a dictionary
-        df_dict = df.to_dict(orient="index")
-
-        # Iterate through the data and pour it into the merged data dictionary
-        # (the data is stored by line numbers which are redundant in this case, so iterate values only)
-        for v in df_dict.values():
-            if samples_type == "Fungi":
-                # if there is no taxonomy, skip
-                if v.get("taxon") == "No_Taxonomy":
-                    continue
-                # Append to mdata in specific kit a dict with a key of fungi id + taxonomy and a value of dict of samples type with their frequences.
-                mdata.setdefault(kit_id, {}).setdefault(
-                    f"id__{v.get('id')};" + v.get("taxon"),
-                    {"F": 0, "R": 0, "S": 0, "Fr": 0, "L": 0},
-                )[sample] = v.get("freq")
-            elif samples_type == "Bacteria":
-                # If there is no taxonomy, skip
-                if v.get("taxon") == "No_Taxonomy":
-                    continue
-                # Append to mdata in specific kit a dict with a key of bacteria id + taxonomy and a value of dict of samples type with their frequences.
-                taxon = f"{v.get('id')};" + " ".join(v.get("taxon").split(" ")[1:])
-                mdata.setdefault(kit_id, {}).setdefault(
-                    taxon, {"F": 0, "R": 0, "S": 0, "Fr": 0, "L": 0}
-                )[sample] = v.get(clean_filename)
+    # Collect every filtered file as long (kit_id, sample, taxon, value) rows. They are pivoted
+    # in one pass into the merged data, in the following format:
+    #
+    #   (kit_id, "bacteria/fungi_id;taxonomy") -> F | R | S | Fr | L
+    #
+    # The frames are kept in the order of the files, so the result does not depend on which
+    # worker finished first.
+    frames = [None] * num_files
+
+    # Parse all the filtered files, in a process pool if there is more than one worker
+    for position, frame in _parse_files(manifest, samples_type, workers):
+        frames[position] = frame
 
         # Count the file as "merged", calculate and update the progress
         progress_counter += 1
@@ -103,178 +137,249 @@ def merge_data(
         progress_var.set(progress)
         percentage_label.configure(text=(("%.2f " % (progress * 100)) + "%"))
 
-    shutil.rmtree(f"./kitDataMerger/filtered_data")
-    return _save_to_csv(mdata, samples_type)
+    if os.path.exists(f"./kitDataMerger/filtered_data"):
+        shutil.rmtree(f"./kitDataMerger/filtered_data")
+    return _pivot_samples(frames)
 
 
-def _sum_prob(d):
+def _parse_files(manifest, samples_type, workers):
     """
-    Sums the prob values of each
+    Parse the filtered files, yielding each result as soon as it is ready.
+
+    Parameters:
+    - manifest: List of SampleFile entries of the filtered files.
+    - samples_type: "Fungi" or "Bacteria".
+    - workers: Number of worker processes, 1 parses the files in the current process.
+
+    Returns:
+    Generator of (position of the file in the manifest, long DataFrame) tuples.
     """
-    ret = {"F": 0, "R": 0, "S": 0, "Fr": 0, "L": 0}
-    for id, probs in d.items():
-        for sample in ret.keys():
-            ret[sample] += probs[sample]
-    return ret
-
-
-def _save_to_csv(mdata, samples_type):
-    m_files_counter = 0
-    for kit, d in mdata.items():
-        m_files_counter += 1
-        prob_sum = _sum_prob(d)
-        formatted_data = {
-            "id": [],
-            "kit_id": [],
-            "Kingdom": [],
-            "Philum": [],
-            "Class": [],
-            "Order": [],
-            "Family": [],
-            "Genus": [],
-            "Species": [],
-            "F": [],
-            "R": [],
-            "S": [],
-            "Fr": [],
-            "L": [],
+    if workers <= 1:
+        for position, sample_file in enumerate(manifest):
+            yield position, _parse_file(sample_file, samples_type)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(_parse_file, sample_file, samples_type): position
+            for position, sample_file in enumerate(manifest)
         }
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+def _parse_file(sample_file, samples_type):
+    """
+    Parse a single filtered file into long (kit_id, sample, taxon, value) rows.
+
+    Parameters:
+    - sample_file: SampleFile entry of the filtered file.
+    - samples_type: "Fungi" or "Bacteria".
+
+    Returns:
+    Pandas DataFrame with the long rows.
+    """
+    # Use Pandas to read the filtered data
+    df = pd.read_csv(sample_file.path)
+
+    # Clean filename from extension and irrelevent info
+    clean_filename = sample_file.name.split(".")[0]
+
+    return _to_long_frame(
+        df, sample_file.kit_id, sample_file.sample.value, clean_filename, samples_type
+    )
+
+
+def _to_long_frame(df, kit_id, sample, clean_filename, samples_type):
+    """
+    Convert a single filtered file into long (kit_id, sample, taxon, value) rows.
+
+    Parameters:
+    - df: Pandas DataFrame of the filtered file.
+    - kit_id: Kit id parsed from the filename.
+    - sample: Sample category parsed from the filename (F, R, S, Fr, L).
+    - clean_filename: Filename without extension (the value column of bacteria files).
+    - samples_type: "Fungi" or "Bacteria".
+
+    Returns:
+    Pandas DataFrame with the columns kit_id, sample, taxon and value.
+    """
+    # If there is no taxonomy, skip
+    df = df[df["taxon"] != "No_Taxonomy"]
+
+    if samples_type == "Fungi":
+        # The key is the fungi id + taxonomy and the value is the frequency of the sample
+        taxon = "id__" + df["id"].astype(str) + ";" + df["taxon"]
+        value = df["freq"]
+    elif samples_type == "Bacteria":
+        # The key is the bacteria id + taxonomy (without its first word) and the value is the sample's column
+        taxon = (
+            df["id"].astype(str)
+            + ";"
+            + df["taxon"].str.split(" ").str[1:].str.join(" ")
+        )
+        value = df[clean_filename] if clean_filename in df.columns else None
+
+    return pd.DataFrame(
+        {"kit_id": kit_id, "sample": sample, "taxon": taxon, "value": value}
+    )
+
+
+def _pivot_samples(frames):
+    """
+    Pivot the long rows of all the filtered files into one row per kit and taxon.
+
+    Parameters:
+    - frames: List of long DataFrames returned by _to_long_frame.
 
-        samples = ["F", "R", "S", "Fr", "L"]
-
-        for id, probs in d.items():
-            # Split the id column to column code and the data
-            id = id.split(";")
-            if samples_type == "Fungi":
-                id = [s.split("__") for s in id]
-
-                # Add the data to a dict
-                formatted_data["kit_id"].append(kit)
-                try:
-                    formatted_data["id"].append(id[0][1] if id[0][1] != "" else "")
-                except IndexError:
-                    formatted_data["id"].append("__")
-
-                try:
-                    formatted_data["Kingdom"].append(
-                        id[1][1].replace("_", " ") if id[1][1] != "" else "__"
-                    )
-                except IndexError:
-                    formatted_data["Kingdom"].append("__")
-
-                try:
-                    formatted_data["Philum"].append(
-                        id[2][1].replace("_", " ") if id[2][1] != "" else "__"
-                    )
-                except IndexError:
-                    formatted_data["Philum"].append("__")
-
-                try:
-                    formatted_data["Class"].append(
-                        id[3][1].replace("_", " ") if id[3][1] != "" else "__"
-                    )
-                except IndexError:
-                    formatted_data["Class"].append("__")
-
-                try:
-                    formatted_data["Order"].append(
-                        id[4][1].replace("_", " ") if id[4][1] != "" else "__"
-                    )
-                except IndexError:
-                    formatted_data["Order"].append("__")
-
-                try:
-                    formatted_data["Family"].append(
-                        id[5][1].replace("_", " ") if id[5][1] != "" else "__"
-                    )
-                except IndexError:
-                    formatted_data["Family"].append("__")
-
-                try:
-                    formatted_data["Genus"].append(
-                        id[6][1].replace("_", " ") if id[6][1] != "" else "__"
-                    )
-                except IndexError:
-                    formatted_data["Genus"].append("__")
-
-                try:
-                    formatted_data["Species"].append(
-                        id[7][1].replace("_", " ") if id[7][1] != "" else "__"
-                    )
-                except IndexError:
-                    formatted_data["Species"].append("__")
-
-            elif samples_type == "Bacteria":
-                formatted_data["kit_id"].append(kit)
-
-                try:
-                    formatted_data["id"].append(
-                        id[0].replace("_", " ") if id[0] != "" else "__"
-                    )
-                except IndexError:
-                    formatted_data["id"].append("__")
-
-                try:
-                    formatted_data["Kingdom"].append(
-                        id[1].replace("_", " ") if id[1] != "" else "__"
-                    )
-                except IndexError:
-                    formatted_data["Kingdom"].append("__")
-
-                try:
-                    formatted_data["Philum"].append(
-                        id[2].replace("_", " ") if id[2] != "" else "__"
-                    )
-                except IndexError:
-                    formatted_data["Philum"].append("__")
-
-                try:
-                    formatted_data["Class"].append(
-                        id[3].replace("_", " ") if id[3] != "" else "__"
-                    )
-                except IndexError:
-                    formatted_data["Class"].append("__")
-
-                try:
-                    formatted_data["Order"].append(
-                        id[4].replace("_", " ") if id[4] != "" else "__"
-                    )
-                except IndexError:
-                    formatted_data["Order"].append("__")
-
-                try:
-                    formatted_data["Family"].append(
-                        id[5].replace("_", " ") if id[5] != "" else "__"
-                    )
-                except IndexError:
-                    formatted_data["Family"].append("__")
-
-                try:
-                    formatted_data["Genus"].append(
-                        id[6].replace("_", " ") if id[6] != "" else "__"
-                    )
-                except IndexError:
-                    formatted_data["Genus"].append("__")
-
-                try:
-                    formatted_data["Species"].append(
-                        id[7].replace("_", " ") if id[7] != "" else "__"
-                    )
-                except IndexError:
-                    formatted_data["Species"].append("__")
-
-            for sample in samples:
-                try:
-                    formatted_data[sample].append(
-                        float(probs[sample] / prob_sum[sample])
-                    )
-                except ZeroDivisionError:
-                    formatted_data[sample].append(0)
-
-        # Convert the dict to a CSV file
-        formatted_df = pd.DataFrame.from_dict(formatted_data)
-        formatted_df.to_csv(
-            path_or_buf=f"./kitDataMerger/merged_asv_data/S_{kit}_{samples_type}.csv",
-            index=False,
+    Returns:
+    Pandas DataFrame indexed by (kit_id, taxon) with a column for each sample category.
+    Kits and taxa keep the order in which they first appeared, and a sample that is
+    missing for a taxon is 0.
+    """
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame(
+            columns=SAMPLES,
+            index=pd.MultiIndex.from_arrays([[], []], names=["kit_id", "taxon"]),
         )
-    return m_files_counter
+
+    long_df = pd.concat(frames, ignore_index=True)
+
+    # Order the (kit, taxon) pairs by the first appearance of the kit and then of the taxon
+    order = long_df[["kit_id", "taxon"]].drop_duplicates()
+    kit_rank = pd.factorize(order["kit_id"])[0]
+    order = order.iloc[np.argsort(kit_rank, kind="stable")]
+
+    # A later file overrides the value of the same kit, taxon and sample
+    long_df = long_df.drop_duplicates(["kit_id", "taxon", "sample"], keep="last")
+
+    wide = long_df.set_index(["kit_id", "taxon", "sample"])["value"].unstack(
+        "sample", fill_value=0
+    )
+    return wide.reindex(index=pd.MultiIndex.from_frame(order)).reindex(
+        columns=SAMPLES, fill_value=0
+    )
+
+
+def _split_taxonomy(taxa, samples_type):
+    """
+    Split the "id;taxonomy" keys of a kit into the id and taxonomy level columns.
+
+    Parameters:
+    - taxa: Pandas Series (or Index) of "bacteria/fungi_id;taxonomy" keys.
+    - samples_type: "Fungi" or "Bacteria".
+
+    Returns:
+    Pandas DataFrame with the columns id, Kingdom, Philum, Class, Order, Family, Genus and Species.
+    Missing or empty levels are "__" and "_" is replaced with a space.
+    """
+    # Split the id column to column code and the data
+    parts = (
+        pd.Series(taxa)
+        .str.split(";", expand=True)
+        .reindex(columns=range(len(TAXONOMY_LEVELS) + 1))
+        .astype(object)
+    )
+    if samples_type == "Fungi":
+        # Fungi levels are prefixed with their rank code (k__Fungi), keep the value only
+        parts = parts.apply(lambda level: level.str.split("__").str[1])
+
+    formatted = parts.apply(
+        lambda level: level.str.replace("_", " ", regex=False).mask(level == "", "__")
+    ).fillna("__")
+
+    # The fungi id is kept as is, and stays empty if there is no id
+    if samples_type == "Fungi":
+        formatted[0] = parts[0].fillna("__")
+
+    formatted.columns = ["id"] + TAXONOMY_LEVELS
+    return formatted
+
+
+def _relative_abundance(probs):
+    """
+    Normalize each sample column of a kit by its sum.
+
+    Parameters:
+    - probs: Pandas DataFrame with a column for each sample category.
+
+    Returns:
+    Pandas DataFrame with the relative abundance of each taxon in each sample.
+    A sample whose sum is 0 is 0 for all the taxa.
+    """
+    # Sum the rows in order, the same way the values were accumulated before
+    prob_sum = pd.Series(
+        probs.to_numpy(dtype=float).cumsum(axis=0)[-1], index=probs.columns
+    )
+    relative = probs.div(prob_sum)
+    return relative.assign(**{sample: 0 for sample in prob_sum.index[prob_sum == 0]})
+
+
+def _format_kit(kit, kit_df, samples_type):
+    """
+    Format the merged data of a single kit into the rows of its CSV file.
+
+    Parameters:
+    - kit: Kit id.
+    - kit_df: Pandas DataFrame of the kit indexed by taxon, with a column for each sample category.
+    - samples_type: "Fungi" or "Bacteria".
+
+    Returns:
+    Pandas DataFrame with the id, kit_id, taxonomy levels and sample columns.
+    """
+    taxonomy = _split_taxonomy(kit_df.index, samples_type)
+    relative = _relative_abundance(kit_df[SAMPLES]).reset_index(drop=True)
+    taxonomy.insert(1, "kit_id", kit)
+    return pd.concat([taxonomy, relative], axis=1)
+
+
+def _write_kit(kit, kit_df, samples_type, file_format="csv"):
+    """
+    Format the merged data of a single kit and save it as a file.
+
+    Parameters:
+    - kit: Kit id.
+    - kit_df: Pandas DataFrame of the kit indexed by taxon, with a column for each sample category.
+    - samples_type: "Fungi" or "Bacteria".
+    - file_format: "csv" or "parquet".
+
+    Returns:
+    None
+    """
+    formatted_df = _format_kit(kit, kit_df, samples_type)
+
+    # Parquet files keep the abundances as floats, even for samples that sum to 0
+    if file_format == "parquet":
+        formatted_df[SAMPLES] = formatted_df[SAMPLES].astype(float)
+
+    # Convert the formatted kit to a file
+    write_frame(
+        formatted_df,
+        f"./kitDataMerger/merged_asv_data/{kit_filename(kit, samples_type, file_format)}",
+        MERGED_CSV_OPTIONS,
+    )
+
+
+def _save_to_csv(merged, samples_type, workers=1, file_format="csv"):
+    """
+    Save the merged data as a file per kit, in a process pool if there is more than one worker.
+
+    Parameters:
+    - merged: Pandas DataFrame indexed by (kit_id, taxon) with a column for each sample category.
+    - samples_type: "Fungi" or "Bacteria".
+    - workers: Number of worker processes, 1 writes the kits in the current process.
+    - file_format: "csv" or "parquet".
+
+    Returns:
+    Number of kits in the merged data. A kit that could not be saved is logged and does not
+    stop the other kits from being saved.
+    """
+    kits = {
+        kit: (kit, kit_df.droplevel("kit_id"), samples_type, file_format)
+        for kit, kit_df in merged.groupby(level="kit_id", sort=False)
+    }
+    _, errors = run_tasks(_write_kit, kits, workers)
+    for kit, e in errors.items():
+        logging.error(f"Could not save the merged data of kit ID {kit}: {e}")
+    return len(kits)
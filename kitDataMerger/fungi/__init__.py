@@ -1 +1 @@
-__all__ = ["get_fungi_id", "update_fungi_ids"]
+__all__ = ["get_fungi_id", "reference", "update_fungi_ids"]
@@ -1,60 +1,10 @@
+import numpy as np
 import pandas as pd
-import re
 
+from .reference import load_reference
 
-def determine_id(row):
-    """
-    This function determines the ID for a given row.
 
-    Parameters:
-    - row (pd.Series): A pandas Series representing a row of data.
-
-    Returns:
-    - str: The determined ID for the given row.
-
-    If the row contains a 'group' field, the function will split the 'group' field by ',' and return the first element.
-    Otherwise, it will return the 'feature_id' field.
-    """
-    if row["group"]:
-        return row["group"].split(", ")[0]
-    else:
-        return row["feature_id"]
-
-
-def check_incertae_sedis(row):
-    """
-    This function checks if the 'taxon' field of the given row contains the string "Incertae_sedis".
-    If it does, it returns an empty string. Otherwise, it returns the 'group' field of the row.
-
-    Parameters:
-    - row (pd.Series): A pandas Series representing a row of data.
-
-    Returns:
-    - str: An empty string if "Incertae_sedis" is found in the 'taxon' field, otherwise the 'group' field.
-    """
-    if "Incertae_sedis" in row["taxon"]:
-        return ""
-    else:
-        return row["group"]
-
-
-def update_number_of_sh_incertae_sedis(row):
-    """
-    This function updates the 'number_of_sh' field of the given row based on whether the 'taxon' field contains the string "Incertae_sedis".
-
-    Parameters:
-    - row (pd.Series): A pandas Series representing a row of data.
-
-    Returns:
-    - int: If "Incertae_sedis" is found in the 'taxon' field, the function returns 0. Otherwise, it returns the original 'number_of_sh' value from the row.
-    """
-    if "Incertae_sedis" in row["taxon"]:
-        return 0
-    else:
-        return row["number_of_sh"]
-
-
-def files_to_id(asv_path, taxonomy_path, rep_path, seq, output_dir):
+def files_to_id(asv_path, taxonomy_path, rep_path, seq, output_dir, reference=None):
     feature_table = pd.read_csv(asv_path)
 
     try:
@@ -84,13 +34,9 @@ def files_to_id(asv_path, taxonomy_path, rep_path, seq, output_dir):
 
     taxonomy.reset_index(drop=True, inplace=True)
 
-    db_tax = pd.read_csv(
-        "sh_taxonomy_qiime_ver9_99_29.11.2022.txt", sep="\t", header=None
-    )
-    db_tax.columns = ["group", "tax"]
-
-    feature_table["taxon_name"] = feature_table["taxon_name"].apply(
-        lambda x: re.sub(r"[^a-zA-Z]+$", "", x)
+    # Remove the characters after the last letter of the taxon names
+    feature_table["taxon_name"] = feature_table["taxon_name"].str.replace(
+        r"[^a-zA-Z]+$", "", regex=True
     )
 
     # Merge the dataframes based on Index and taxon
@@ -109,21 +55,27 @@ def files_to_id(asv_path, taxonomy_path, rep_path, seq, output_dir):
 
     # merged_df3=pd.merge(merged_df2, db_tax, left_on="taxon", right_on="tax", how="inner")
 
-    tax_group_mapping = db_tax.set_index("tax")["group"].to_dict()
+    # The taxonomy reference is only loaded once, see load_reference
+    tax_group_mapping = reference if reference is not None else load_reference()
 
-    merged_df2["group"] = merged_df2["taxon"].map(tax_group_mapping)
-    merged_df2["number_of_sh"] = merged_df2["taxon"].map(
-        lambda x: len(tax_group_mapping.get(x, []))
-    )
+    merged_df2["group"] = merged_df2["taxon"].map(tax_group_mapping.get)
 
     merged_df2["group"] = merged_df2["group"].fillna("")
+    merged_df2["number_of_sh"] = merged_df2["group"].str.len()
 
-    merged_df2["group"] = merged_df2.apply(check_incertae_sedis, axis=1)
-    merged_df2["number_of_sh"] = merged_df2.apply(
-        update_number_of_sh_incertae_sedis, axis=1
+    # Taxa of an uncertain placement (Incertae sedis) have no group
+    incertae_sedis = merged_df2["taxon"].str.contains("Incertae_sedis", regex=False)
+    merged_df2["group"] = np.where(incertae_sedis, "", merged_df2["group"])
+    merged_df2["number_of_sh"] = np.where(
+        incertae_sedis, 0, merged_df2["number_of_sh"]
     )
 
-    merged_df2["id"] = merged_df2.apply(determine_id, axis=1)
+    # The id is the first SH of the group, or the feature id if there is no group
+    merged_df2["id"] = np.where(
+        merged_df2["group"] != "",
+        merged_df2["group"].str.split(", ").str[0],
+        merged_df2["feature_id"],
+    )
 
     aggregation_functions = {
         "feature_id": list,
@@ -0,0 +1,86 @@
+import os
+
+import pickle
+import logging
+import threading
+from types import MappingProxyType
+
+import pandas as pd
+
+# The UNITE taxonomy reference (QIIME release), in the project directory
+REFERENCE_PATH = "sh_taxonomy_qiime_ver9_99_29.11.2022.txt"
+
+# The parsed reference is kept with the other caches of the program
+CACHE_PATH = "./kitDataMerger/cache/sh_taxonomy.pickle"
+
+# The references loaded by this process, by their path
+_references = {}
+_lock = threading.Lock()
+
+
+def load_reference(path=REFERENCE_PATH, cache_path=CACHE_PATH):
+    """
+    Load the taxonomy reference, mapping each taxon to its species hypothesis (SH) group.
+
+    The reference is only parsed once per process, and again only when the file changes.
+    The parsed reference is also saved to cache_path, so the next runs load it from there.
+
+    Parameters:
+    - path: Path of the reference, a tab separated file of group and taxon lines.
+    - cache_path: Path of the parsed reference, nothing is saved if None.
+
+    Returns:
+    Read-only dictionary mapping each taxon to its group, if a taxon appears more than once
+    the last group wins.
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    with _lock:
+        loaded = _references.get(path)
+        if loaded is not None and loaded[0] == version:
+            return loaded[1]
+
+        mapping = _read_cache(cache_path, path, version)
+        if mapping is None:
+            db_tax = pd.read_csv(path, sep="\t", header=None)
+            db_tax.columns = ["group", "tax"]
+            mapping = db_tax.set_index("tax")["group"].to_dict()
+            _write_cache(cache_path, path, version, mapping)
+
+        reference = MappingProxyType(mapping)
+        _references[path] = (version, reference)
+        return reference
+
+
+def _read_cache(cache_path, path, version):
+    # The cache is only used if it was parsed from the same file
+    if cache_path is None or not os.path.exists(cache_path):
+        return None
+    try:
+        with open(cache_path, "rb") as file:
+            cached = pickle.load(file)
+    except Exception as e:
+        # A corrupt cache can raise almost any error while unpickling, it is parsed again
+        logging.warning(f"Could not read the cached taxonomy reference: {e}")
+        return None
+    if not isinstance(cached, dict) or not isinstance(cached.get("mapping"), dict):
+        logging.warning("The cached taxonomy reference is not valid, it is parsed again")
+        return None
+    if cached.get("path") != path or cached.get("version") != version:
+        return None
+    return cached["mapping"]
+
+
+def _write_cache(cache_path, path, version, mapping):
+    if cache_path is None:
+        return
+    # Write to a temporary file first, so a crash never leaves a broken cache
+    os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+    with open(f"{cache_path}.tmp", "wb") as file:
+        pickle.dump(
+            {"path": path, "version": version, "mapping": mapping},
+            file,
+            protocol=pickle.HIGHEST_PROTOCOL,
+        )
+    os.replace(f"{cache_path}.tmp", cache_path)
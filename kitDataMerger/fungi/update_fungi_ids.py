@@ -1,9 +1,27 @@
 import os
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 from .get_fungi_id import files_to_id
-from tkinter.messagebox import showerror
+from .reference import load_reference
+from ..progress import report_error
+
+
+def update_fungi_ids(fungi_data_folder, progress_var, percentage_label, workers=1):
+    """
+    Find the ids of the fungi of every ASV file, and save the public and private data of
+    each seq folder to "./kitDataMerger/fungi/data".
 
+    Parameters:
+    - fungi_data_folder: Directory of the seq folders, each with "ASV", "REP" and "REP_TAXONOMY" folders.
+    - progress_var: Tkinter variable for tracking progress.
+    - percentage_label: Tkinter label for displaying progress percentage.
+    - workers: Number of worker processes, 1 processes the files in the current process.
 
-def update_fungi_ids(fungi_data_folder, progress_var, percentage_label):
+    Returns:
+    None. Raises FileNotFoundError if the taxonomy reference or the files of an ASV file
+    are missing.
+    """
     # Create "./kitDataMerger/fungi/data/microbiome-private" if it is not exists
     if not os.path.exists(f"./kitDataMerger/fungi/data/microbiome-private"):
         os.makedirs(f"./kitDataMerger/fungi/data/microbiome-private")
@@ -12,38 +30,80 @@ def update_fungi_ids(fungi_data_folder, progress_var, percentage_label):
     if not os.path.exists(f"./kitDataMerger/fungi/data/microbiome-public"):
         os.makedirs(f"./kitDataMerger/fungi/data/microbiome-public")
 
-    progress_counter = 0
-
-    # Count total amount of files
-    total_files = 0
-    for seq_folder in os.listdir(fungi_data_folder):
-        total_files += len(
-            [_ for _ in range(len(os.listdir(f"{fungi_data_folder}/{seq_folder}/ASV")))]
-        )
-
+    # Collect the files of every ASV file, in the order of the seq folders
+    jobs = []
     for seq_folder in os.listdir(fungi_data_folder):
         # Create seq folders in the public directory and the private directory
         os.makedirs(f"./kitDataMerger/fungi/data/microbiome-private/{seq_folder}")
         os.makedirs(f"./kitDataMerger/fungi/data/microbiome-public/{seq_folder}")
         for file in os.listdir(f"{fungi_data_folder}/{seq_folder}/ASV"):
-            try:
-                # Call the files_to_id function to find the id of the fungis
-                files_to_id(
+            jobs.append(
+                dict(
                     asv_path=f"{fungi_data_folder}/{seq_folder}/ASV/{file}",
                     taxonomy_path=f"{fungi_data_folder}/{seq_folder}/REP_TAXONOMY/{file.split('.')[0]}_rep_taxonomy.fasta.{file.split('.')[1]}",
                     rep_path=f"{fungi_data_folder}/{seq_folder}/REP/{file.split('.')[0]}_rep.fasta.{file.split('.')[1]}",
                     seq=seq_folder,
                     output_dir=f"./kitDataMerger/fungi/data",
                 )
+            )
+    total_files = len(jobs)
 
+    progress_counter = 0
+    errors = {}
+    try:
+        # Load the taxonomy reference before the workers start, so forked workers share it
+        reference = load_reference()
+    except FileNotFoundError as e:
+        # No file can get its ids without the reference, report it before any of the files
+        errors[-1] = e
+    else:
+        if workers <= 1:
+            for position, job in enumerate(jobs):
+                try:
+                    # Call the files_to_id function to find the id of the fungis
+                    files_to_id(**job, reference=reference)
+                except FileNotFoundError as e:
+                    errors[position] = e
+                    break
                 progress_counter += 1
                 progress = progress_counter / total_files
                 progress_var.set(progress)
                 percentage_label.configure(text=(("%.2f " % (progress * 100)) + "%"))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {
+                    executor.submit(files_to_id, **job): position
+                    for position, job in enumerate(jobs)
+                }
+                for future in as_completed(futures):
+                    try:
+                        future.result()
+                    except FileNotFoundError:
+                        # Stop at the first missing file, like a sequential run would
+                        executor.shutdown(wait=True, cancel_futures=True)
+                        break
+                    except Exception:
+                        # Do not wait for the queued files before raising the error
+                        executor.shutdown(wait=True, cancel_futures=True)
+                        raise
+                    progress_counter += 1
+                    progress = progress_counter / total_files
+                    progress_var.set(progress)
+                    percentage_label.configure(
+                        text=(("%.2f " % (progress * 100)) + "%")
+                    )
+
+            # Collect the missing files of all the jobs that ran
+            for future, position in futures.items():
+                if future.done() and not future.cancelled():
+                    if isinstance(future.exception(), FileNotFoundError):
+                        errors[position] = future.exception()
 
-            # Raise an error if file is not exist
-            except FileNotFoundError as e:
-                progress_var.set(0)
-                percentage_label.configure(text="0 %")
-                showerror("Error", "An error has occurred. File Not Found.")
-                raise FileNotFoundError(e)
+    # Raise an error if file is not exist
+    if errors:
+        for position in sorted(errors):
+            logging.error(f"Could not find the fungi ids: {errors[position]}")
+        progress_var.set(0)
+        percentage_label.configure(text="0 %")
+        report_error(percentage_label, "Error", "An error has occurred. File Not Found.")
+        raise FileNotFoundError(errors[min(errors)])
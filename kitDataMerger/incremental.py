@@ -0,0 +1,131 @@
+import os
+
+import json
+import hashlib
+
+from .storage import kit_filename
+
+# The state of the last incremental run is kept per samples type
+STATE_PATH = "./kitDataMerger/cache/{samples_type}_state.json"
+
+
+def file_digest(path):
+    """
+    Calculate the content digest of a file.
+
+    Parameters:
+    - path: Path of the file.
+
+    Returns:
+    Hex digest of the file's content.
+    """
+    digest = hashlib.blake2b()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_state(samples_type):
+    """
+    Load the state saved by the last incremental run.
+
+    Parameters:
+    - samples_type: "Fungi" or "Bacteria".
+
+    Returns:
+    Dictionary with the metadata digest ("meta") and the input files ("files"),
+    keyed by path with their size, mtime, digest and kit id.
+    """
+    try:
+        with open(STATE_PATH.format(samples_type=samples_type), "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"meta": None, "files": {}}
+
+
+def save_state(samples_type, state):
+    """
+    Save the state of an incremental run, once all its outputs were written.
+
+    Parameters:
+    - samples_type: "Fungi" or "Bacteria".
+    - state: Dictionary returned by plan_incremental.
+
+    Returns:
+    None
+    """
+    path = STATE_PATH.format(samples_type=samples_type)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(state, f)
+
+
+def plan_incremental(manifest, meta_path, samples_type, file_format="csv"):
+    """
+    Find the kits that have to be rebuilt since the last incremental run.
+
+    A kit is rebuilt if one of its files was added, removed or changed, or if one of its
+    outputs is missing. If the metadata file changed, all the kits are rebuilt.
+    A file whose size and mtime did not change is not hashed again.
+
+    Parameters:
+    - manifest: List of SampleFile entries of the data directory.
+    - meta_path: Path of the metadata file.
+    - samples_type: "Fungi" or "Bacteria".
+    - file_format: File format of the outputs, "csv" or "parquet".
+
+    Returns:
+    Tuple of the set of kit ids to rebuild (including removed kits) and the new state,
+    to be saved with save_state once the run is done.
+    """
+    state = load_state(samples_type)
+    files = {}
+    kits = set()
+
+    for sample_file in manifest:
+        previous = state["files"].get(sample_file.path)
+        if (
+            previous is not None
+            and previous["size"] == sample_file.size
+            and previous["mtime"] == sample_file.mtime
+        ):
+            digest = previous["digest"]
+        else:
+            digest = file_digest(sample_file.path)
+
+        if (
+            previous is None
+            or previous["digest"] != digest
+            or previous["kit_id"] != sample_file.kit_id
+        ):
+            kits.add(sample_file.kit_id)
+
+        files[sample_file.path] = {
+            "size": sample_file.size,
+            "mtime": sample_file.mtime,
+            "digest": digest,
+            "kit_id": sample_file.kit_id,
+        }
+
+    # Kits of files that no longer exist have to be rebuilt (or removed)
+    for path, previous in state["files"].items():
+        if path not in files:
+            kits.add(previous["kit_id"])
+
+    all_kits = {sample_file.kit_id for sample_file in manifest}
+
+    # Rebuild everything if the metadata changed
+    meta_digest = file_digest(meta_path)
+    if meta_digest != state["meta"]:
+        kits |= all_kits
+
+    # Rebuild the kits whose outputs were deleted since the last run
+    for kit in all_kits:
+        filename = kit_filename(kit, samples_type, file_format)
+        merged_path = f"./kitDataMerger/merged_asv_data/{filename}"
+        public_path = f"./kitDataMerger/microbiome-public/{filename}"
+        if not os.path.exists(merged_path) or not os.path.exists(public_path):
+            kits.add(kit)
+
+    return kits, {"meta": meta_digest, "files": files}
@@ -0,0 +1,84 @@
+import os
+
+from typing import List, NamedTuple
+
+from .sample_name import Sample, normalize_sample_name, parse_sample_name
+
+
+class SampleFile(NamedTuple):
+    """
+    A sample file found while scanning the data directory.
+
+    Fields:
+    - path: Path the file should be read from.
+    - name: Filtered filename of the sample (e.g. S12_F.CSV).
+    - kit_id: Kit id parsed from the filename.
+    - sample: Sample category parsed from the filename (F, R, S, Fr, L).
+    - size: Size of the file in bytes.
+    - mtime: Last modification time of the file.
+    """
+
+    path: str
+    name: str
+    kit_id: int
+    sample: Sample
+    size: int
+    mtime: float
+
+
+def scan_samples(data_dir, sample_type) -> List[SampleFile]:
+    """
+    Scan the data directory once and list its sample files.
+
+    Parameters:
+    - data_dir: Directory of the samples (for fungi, a directory of seq folders).
+    - sample_type: "Fungi" or "Bacteria".
+
+    Returns:
+    List of SampleFile entries, in the order they were found.
+    """
+    if sample_type == "Fungi":
+        manifest = []
+        with os.scandir(data_dir) as seq_folders:
+            for seq_folder in seq_folders:
+                if seq_folder.is_dir():
+                    manifest.extend(scan_directory(seq_folder.path, fungi=True))
+        return manifest
+    return scan_directory(data_dir)
+
+
+def scan_directory(directory, fungi=False) -> List[SampleFile]:
+    """
+    Scan a flat directory once and list its sample files.
+
+    Parameters:
+    - directory: Directory to scan.
+    - fungi: Whether the files are fungi files, whose filtered filenames get a ".csv" extension.
+
+    Returns:
+    List of SampleFile entries, in the order they were found.
+    """
+    manifest = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            # Only files that match the creteria (files that starts with "S") are samples
+            parsed = parse_sample_name(entry.name)
+            if not entry.is_file() or parsed is None:
+                continue
+
+            name = normalize_sample_name(entry.name)
+            if fungi:
+                name = f"{'.'.join(name.split('.')[:-1])}.csv"
+
+            stat = entry.stat()
+            manifest.append(
+                SampleFile(
+                    path=entry.path,
+                    name=name,
+                    kit_id=parsed.kit_id,
+                    sample=parsed.sample,
+                    size=stat.st_size,
+                    mtime=stat.st_mtime,
+                )
+            )
+    return manifest
@@ -1,93 +1,155 @@
 import os
 
 import pandas as pd
-import re
-import shutil
 import logging
 
+from .sample_name import parse_merged_name
+from .storage import (
+    MERGED_CSV_OPTIONS,
+    PUBLIC_CSV_OPTIONS,
+    check_format,
+    clear_kit_files,
+    kit_files,
+    read_frame,
+    write_frame,
+)
+
 # Intialize logger
 logging.getLogger("kitDataMerger")
 
 
-def merge_meta_data():
+META_COLUMNS = [
+    "Kit ID",
+    "Date",
+    "Location",
+    "Coordination",
+    "Location Picture",
+    "Treatment",
+    "Plant Picture",
+    "Temperature",
+    "School",
+    "Scientific Plant Name",
+    "Hebrew Plant Name",
+    "TD",
+    "TDmin",
+    "TDmax",
+    "TG",
+    "WSmax",
+    "WDmax",
+    "WS",
+    "WD",
+    "STDwd",
+    "Grad",
+    "NIP",
+    "DiffR",
+    "RH",
+    "Rain",
+]
+
+
+def merge_meta_data(samples_type, kits=None, file_format="csv"):
+    """
+    Merge the metadata of each kit into its merged data.
+
+    Parameters:
+    - samples_type: "Fungi" or "Bacteria".
+    - kits: Ids of the kits to merge, all the merged kits are merged if not provided.
+        The outputs of the other kits are kept as they are.
+    - file_format: File format of the public data, "csv" or "parquet".
+
+    Returns:
+    None
+    """
+    check_format(file_format)
+
     # Open and read the provided metadata file
     df_meta = pd.read_csv(
         f"./kitDataMerger/meteorology/meta_data_final.csv",
         encoding="utf-16",
-        usecols=[
-            "Kit ID",
-            "Date",
-            "Location",
-            "Coordination",
-            "Location Picture",
-            "Treatment",
-            "Plant Picture",
-            "Temperature",
-            "School",
-            "Scientific Plant Name",
-            "Hebrew Plant Name",
-            "TD",
-            "TDmin",
-            "TDmax",
-            "TG",
-            "WSmax",
-            "WDmax",
-            "WS",
-            "WD",
-            "STDwd",
-            "Grad",
-            "NIP",
-            "DiffR",
-            "RH",
-            "Rain",
-        ],
+        usecols=META_COLUMNS,
     )
-    # Create or clear a destination directory
-    if os.path.exists(f"./kitDataMerger/microbiome-public"):
-        shutil.rmtree(f"./kitDataMerger/microbiome-public")
-    os.makedirs(f"./kitDataMerger/microbiome-public")
-
-    # Iterate through the merged asv data
-    for file in os.listdir(f"./kitDataMerger/merged_asv_data"):
+    # Remove the previous outputs of the kits (only the given kits if provided), the outputs
+    # of the other samples type are kept
+    clear_kit_files(f"./kitDataMerger/microbiome-public", samples_type, kits)
 
-        # Load the kit file into a dict
-        df_kit = pd.read_csv(f"./kitDataMerger/merged_asv_data/{file}")
-        df_kit_dict = df_kit.to_dict()
+    # Iterate through the merged asv data of the samples type
+    for file in kit_files(f"./kitDataMerger/merged_asv_data", samples_type, kits):
 
         # Extract the kit id from the filename
-        clean_filename = file.split(".")[0]
-        id = re.search(r"S_(\d+)*", clean_filename).group(1)
-
-        # Find the kit's matching metadata and load it into a dict
-        kit_row = (df_meta.loc[df_meta["Kit ID"] == id]).to_dict(orient="split")
-        for keyIndex in range(len(kit_row["columns"])):
-            for index in range(len(df_kit_dict["kit_id"])):
-                try:
-                    df_kit_dict[kit_row["columns"][keyIndex]][index] = kit_row["data"][
-                        0
-                    ][keyIndex]
-                except KeyError:
-                    df_kit_dict[kit_row["columns"][keyIndex]] = {}
-                    df_kit_dict[kit_row["columns"][keyIndex]][index] = kit_row["data"][
-                        0
-                    ][keyIndex]
-                except IndexError:
-                    continue
-        df = pd.DataFrame.from_dict(df_kit_dict)
-
-        # make sure that the kit id have the correct amount of columns, if not, the function will log to a log file
-        if len(df.columns) < 38:
-            logging.error(
-                f"Not enough columns in kit ID {id}: {len(df.columns)}\nThe columns are: {df.columns}"
-            )
+        id = parse_merged_name(file)
+
+        # Load the kit file and merge its metadata
+        df_kit = read_frame(f"./kitDataMerger/merged_asv_data/{file}", MERGED_CSV_OPTIONS)
+        df = _join_kit(df_kit, df_meta, id)
 
         try:
-            # Convert the dataframe to a csv file
-            df.to_csv(
-                f"./kitDataMerger/microbiome-public/{file}",
-                index=False,
-                encoding="utf-16",
-                sep="\t",
+            # Convert the dataframe to a file
+            public_filename = f"{os.path.splitext(file)[0]}.{file_format}"
+            write_frame(
+                df,
+                f"./kitDataMerger/microbiome-public/{public_filename}",
+                PUBLIC_CSV_OPTIONS,
             )
         except Exception as e:
             print(e)
+
+
+def join_meta_data(kit_frames, df_meta):
+    """
+    Merge the metadata of each kit into its merged data, in memory.
+
+    Parameters:
+    - kit_frames: Dictionary mapping the merged filename of each kit to its DataFrame.
+    - df_meta: Pandas DataFrame of the metadata with the weather information.
+
+    Returns:
+    Dictionary mapping the public filename of each kit to its DataFrame.
+    """
+    # Keep the order of the metadata's columns, like reading the metadata file with usecols
+    df_meta = df_meta[[column for column in df_meta.columns if column in META_COLUMNS]]
+    return {
+        file: _join_kit(df_kit, df_meta, parse_merged_name(file))
+        for file, df_kit in kit_frames.items()
+    }
+
+
+def _join_kit(df_kit, df_meta, id):
+    """
+    Merge the metadata of a single kit into its merged data.
+
+    Parameters:
+    - df_kit: Pandas DataFrame of the kit's merged data.
+    - df_meta: Pandas DataFrame of the metadata.
+    - id: Kit id.
+
+    Returns:
+    Pandas DataFrame of the kit's merged data with its metadata columns.
+    """
+    # Load the kit into a dict
+    df_kit_dict = df_kit.to_dict()
+
+    # Find the kit's matching metadata and load it into a dict
+    kit_row = (df_meta.loc[df_meta["Kit ID"].astype(str) == str(id)]).to_dict(
+        orient="split"
+    )
+    for keyIndex in range(len(kit_row["columns"])):
+        for index in range(len(df_kit_dict["kit_id"])):
+            try:
+                df_kit_dict[kit_row["columns"][keyIndex]][index] = kit_row["data"][0][
+                    keyIndex
+                ]
+            except KeyError:
+                df_kit_dict[kit_row["columns"][keyIndex]] = {}
+                df_kit_dict[kit_row["columns"][keyIndex]][index] = kit_row["data"][0][
+                    keyIndex
+                ]
+            except IndexError:
+                continue
+    df = pd.DataFrame.from_dict(df_kit_dict)
+
+    # make sure that the kit id have the correct amount of columns, if not, the function will log to a log file
+    if len(df.columns) < 38:
+        logging.error(
+            f"Not enough columns in kit ID {id}: {len(df.columns)}\nThe columns are: {df.columns}"
+        )
+    return df
@@ -1,25 +1,89 @@
 import os
 
 import requests as req
-from datetime import datetime, timedelta
-import pytz
+from datetime import date, timedelta
 import pandas as pd
 from requests.exceptions import ConnectionError
-import tkinter as tk
-from tkinter.messagebox import showerror
 import numpy as np
 import geopy.distance
-from typing import List
-import re
 import logging
-import dotenv
-import certifi
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-# Load environment variables from a .env file
-headers = {"Authorization": os.environ.get("API_KEY")}
+from ..progress import report_error
+from ..sample_name import parse_merged_name
+from .ims_client import IMS_API_URL, ims_get, log_stats, stats
+from .observation_cache import ObservationCache
+from .providers import WeatherProvider
+from .station_catalogue import StationCatalogue, StationIndex, build_station_index
 
-# Set API key for authorization
-dotenv.load_dotenv(dotenv.find_dotenv())
+# Mean earth radius in kilometers, used by the haversine pre-selection of the stations
+EARTH_RADIUS = 6371.0088
+
+# Number of samples whose distances to the stations are calculated at once
+HAVERSINE_CHUNK_SIZE = 4096
+
+# The weather columns of the metadata, in the order they are added to it
+WEATHER_COLUMNS = [
+    "TD",
+    "TDmin",
+    "TDmax",
+    "TG",
+    "WSmax",
+    "WDmax",
+    "WS",
+    "WD",
+    "STDwd",
+    "Grad",
+    "NIP",
+    "DiffR",
+    "RH",
+    "Rain",
+]
+
+# The channels of the IMS stations that are saved in the metadata
+WEATHER_CHANNELS = frozenset(WEATHER_COLUMNS)
+
+# The value of a weather column that was looked up but the stations did not have
+MISSING_WEATHER = "__"
+
+# Key of the attrs of the metadata that lists the rows whose weather was looked up
+WEATHER_ROWS = "weather_rows"
+
+# Valid sample dates, in the MM/DD/YYYY format
+DATE_PATTERN = r"^(0[1-9]|1[0-2])/(0[1-9]|[12][0-9]|3[01])/(19|20)\d{2}$"
+
+# Days of a station that are at most this many days apart are fetched in a single request
+FETCH_MAX_GAP_DAYS = 3
+
+# Maximum number of stations whose data is fetched at the same time
+FETCH_WORKERS = 8
+
+# The observations of the stations are cached on disk, complete days never change
+observation_cache = ObservationCache()
+
+# The station list and its spatial index are cached on disk, the list changes very rarely
+station_catalogue = StationCatalogue()
+
+
+class IMSProvider(WeatherProvider):
+    """
+    Serve the stations and observations from the live IMS API, through the disk caches.
+    """
+
+    def __init__(self, catalogue=None, cache=observation_cache):
+        """
+        Parameters:
+        - catalogue: StationCatalogue of the stations, the shared catalogue if not provided.
+        - cache: ObservationCache of the observations, nothing is cached if None.
+        """
+        self.catalogue = catalogue if catalogue is not None else station_catalogue
+        self.cache = cache
+
+    def stations(self):
+        return self.catalogue.index()
+
+    def fetch(self, station_id, days):
+        return fetch_station_data(station_id, days, self.cache)
 
 
 def distance(station, x, y):
@@ -42,79 +106,215 @@ def distance(station, x, y):
         return 999999
 
 
-def get_timezone(d: datetime):
+def nearby_stations(cords, stations, radius):
     """
-    Get the timezone information for a given datetime object.
+    Find the stations within a radius of each coordinate, sorted by their distance.
+
+    The distances to all the stations are first calculated at once with the haversine formula
+    (on a sphere), and only the stations that are close enough are measured again with the
+    exact geodesic distance. The sphere is off the ellipsoid by up to 0.5%, so the stations
+    are pre-selected with a 1% margin.
 
     Parameters:
-    - d: Datetime object.
+    - cords: List of [latitude, longitude] coordinates.
+    - stations: List of environmental stations, or their StationIndex.
+    - radius: Maximum distance for station inclusion, in kilometers.
 
     Returns:
-    Timezone information as a string.
+    List with a list of stations (dictionaries with 'id' and 'dis' keys) for each coordinate,
+    sorted by their geodesic distance.
     """
-    israel = (
-        pytz.timezone("Israel")
-        .localize(d)
-        .strftime("%Y/%m/%d  %H:%M:%S %Z/%z")
-        .split("  ")
-    )
-    return "+02:00" if "IST" in israel[1] else "+03:00"
+    # Stations without a location are never within the radius
+    if not isinstance(stations, StationIndex):
+        stations = build_station_index(stations)
+
+    if not cords or not stations.stations:
+        return [[] for _ in cords]
+
+    station_lat = stations.latitudes
+    station_lon = stations.longitudes
+    cords_array = np.radians(np.array([cord[:2] for cord in cords], dtype=float))
+
+    nearby = []
+    # Calculate the distances in chunks of samples, to keep the distances matrix small
+    for start in range(0, len(cords_array), HAVERSINE_CHUNK_SIZE):
+        chunk = cords_array[start : start + HAVERSINE_CHUNK_SIZE]
+        lat = chunk[:, 0:1]
+        lon = chunk[:, 1:2]
+        a = (
+            np.sin((station_lat - lat) / 2) ** 2
+            + np.cos(lat) * np.cos(station_lat) * np.sin((station_lon - lon) / 2) ** 2
+        )
+        approximate = 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+        for offset, row in enumerate(approximate <= radius * 1.01):
+            cord = cords[start + offset]
+            sample_stations = []
+            for station_index in np.flatnonzero(row):
+                station = stations.stations[station_index]
+                dis = distance(station, cord[0], cord[1])
+                if dis <= radius:
+                    sample_stations.append(dict(id=station["stationId"], dis=dis))
+            sample_stations.sort(key=lambda a: a.get("dis"))
+            nearby.append(sample_stations)
+    return nearby
+
+
+def fetch_stations_data(
+    station_days, workers, progress_var, percentage_label, provider=None
+):
+    """
+    Fetch the data of several stations concurrently, in a bounded thread pool.
+
+    Parameters:
+    - station_days: Dictionary mapping each station id to the sorted list of days (date objects)
+        to fetch.
+    - workers: Maximum number of requests made at the same time.
+    - progress_var: Tkinter variable for tracking progress.
+    - percentage_label: Tkinter label for displaying progress percentage.
+    - provider: WeatherProvider of the observations, the IMS API if not provided.
+
+    Returns:
+    Dictionary mapping each station id to its list of observations, or None if they could not
+    be retrieved. If requests failed, the exception of the first failed station (in the order of
+    station_days) is raised, like a sequential run would.
+    """
+    if provider is None:
+        provider = IMSProvider()
+    number_of_stations = len(station_days)
+    progress_counter = 0
+    responses = {}
+    errors = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {
+            executor.submit(provider.fetch, station_id, days): station_id
+            for station_id, days in station_days.items()
+        }
+        for future in as_completed(futures):
+            station_id = futures[future]
+            try:
+                responses[station_id] = future.result()
+            except Exception as e:
+                errors[station_id] = e
+            progress_counter += 1
+            progress = progress_counter / number_of_stations
+            progress_var.set(progress)
+            percentage_label.configure(text=(("%.2f " % (progress * 100)) + "%"))
 
+    for station_id in station_days:
+        if station_id in errors:
+            raise errors[station_id]
+    return responses
 
-def round_timestamp(d: datetime, tz: str):
+
+def fetch_station_data(station_id, days, cache=None):
     """
-    Round the timestamp of a given datetime object.
+    Fetch the observations of a station, downloading only the days that are not cached.
 
     Parameters:
-    - d: Datetime object.
-    - tz: Timezone information.
+    - station_id: Id of the station.
+    - days: Sorted list of the days (date objects) to fetch.
+    - cache: ObservationCache of the observations, nothing is cached if None.
 
     Returns:
-    Rounded timestamp as a formatted string.
+    List of the observations of the days, in the format of the "data" list of the IMS API,
+    or None if the station's data could not be retrieved.
     """
-    return (
-        f"{d.year}-{str(d.month).zfill(2)}-{str(d.day).zfill(2)}"
-        f"T{str(d.hour).zfill(2)}:{str(round(d.minute, 2)).zfill(2)}:00{tz}"
-    )
-
+    observations = cache.get(station_id, days) if cache is not None else {}
+
+    # Download the missing days, a request per range of close missing days
+    failed = False
+    missing = [day for day in days if day not in observations]
+    for start, end in _day_ranges(missing, FETCH_MAX_GAP_DAYS):
+        response = ims_get(
+            f"{IMS_API_URL}/stations/{station_id}/data",
+            params={
+                "from": _format_day(start),
+                "to": _format_day(end + timedelta(days=1)),
+            },
+        )
+        if response.status_code == 200:
+            data = response.json()["data"]
+        elif response.status_code == 204:
+            # There are no observations in these days (yet), they are not cached
+            data = []
+        else:
+            failed = True
+            continue
 
-def next_day(d: datetime):
+        downloaded = {
+            start + timedelta(days=offset): []
+            for offset in range((end - start).days + 1)
+        }
+        for observation in data:
+            day = date.fromisoformat(observation["datetime"][:10])
+            if day in downloaded:
+                downloaded[day].append(observation)
+        if cache is not None:
+            cache.put(station_id, downloaded)
+        observations.update(downloaded)
+
+    if failed and not observations:
+        return None
+    return [
+        observation
+        for day in days
+        if day in observations
+        for observation in observations[day]
+    ]
+
+
+def index_observations(observations):
     """
-    Calculate the datetime for the next day.
+    Index the observations of a station by their datetime.
 
     Parameters:
-    - d: Datetime object.
+    - observations: List of observations, in the format of the "data" list of the IMS API.
 
     Returns:
-    Datetime object for the next day.
+    Dictionary mapping each datetime to a dictionary of the valid weather channels' values
+    by their name. If a datetime appears more than once, the later values win.
     """
-    return d + timedelta(days=1)
+    index = {}
+    for observation in observations:
+        values = index.setdefault(observation["datetime"], {})
+        for channel in observation["channels"]:
+            if channel["name"] in WEATHER_CHANNELS and channel["valid"]:
+                values[channel["name"]] = channel["value"]
+    return index
 
 
-def get_stations_json():
+def _day_ranges(days, max_gap=0):
     """
-    Retrieve JSON data containing information about stations.
+    Group sorted days into ranges of consecutive (or close) days.
+
+    Parameters:
+    - days: Sorted list of date objects.
+    - max_gap: Maximum number of days between two days of the same range.
 
     Returns:
-    JSON data with station information.
+    List of (first day, last day) tuples.
     """
-    return get_response_json(f"https://api.ims.gov.il/v1/envista/stations")
+    ranges = []
+    for day in days:
+        if ranges and day <= ranges[-1][1] + timedelta(days=max_gap + 1):
+            ranges[-1] = (ranges[-1][0], day)
+        else:
+            ranges.append((day, day))
+    return ranges
 
 
-def get_response_json(url, params=None):
+def _format_day(day):
     """
-    Make a GET request to the specified URL and retrieve JSON data.
+    Format a day for the "from" and "to" parameters of the IMS API.
 
     Parameters:
-    - url: URL for the GET request.
-    - params: Optional parameters for the request.
+    - day: Date object.
 
     Returns:
-    JSON data from the response.
+    The day as YYYY/MM/DD.
     """
-    response = req.get(url, params=params, headers=headers, verify=certifi.where())
-    response.raise_for_status()
-    return response.json()
+    return f"{day.year}/{str(day.month).zfill(2)}/{str(day.day).zfill(2)}"
 
 
 def parse_cord(d):
@@ -130,6 +330,37 @@ def parse_cord(d):
     return [float(c.strip(" ")) for c in d.split("," if "," in d else " ")]
 
 
+def plan_fetches(samples_by_station, fetched, skipped=frozenset()):
+    """
+    Plan the fetches of a round: the days of each station's samples that were not fetched
+    from the station in a previous round.
+
+    Parameters:
+    - samples_by_station: Dictionary with samples grouped by station ID (see sort_samples).
+    - fetched: Dictionary mapping each station id to the values of the timestamps that were
+        already fetched from it.
+    - skipped: Ids of the stations that are never fetched, e.g. the stations without any
+        weather channel. Their samples fall back to their next station.
+
+    Returns:
+    Dictionary mapping each station id to the sorted list of days (date objects) to fetch,
+    the stations with nothing to fetch are left out.
+    """
+    station_days = {}
+    for station_id, station_samples in samples_by_station.items():
+        if station_id in skipped:
+            continue
+        known = fetched.get(station_id, {})
+        days = {
+            sample["date"].date()
+            for sample in station_samples
+            if sample["timestamp"] not in known
+        }
+        if days:
+            station_days[station_id] = sorted(days)
+    return station_days
+
+
 def sort_samples(
     samples,
     progress_var,
@@ -181,34 +412,6 @@ def sort_samples(
     return sample_by_stations
 
 
-def is_valid_date(date_string):
-    """
-    Check if a date string is in a valid format (MM/DD/YYYY).
-
-    Parameters:
-    - date_string: Date string.
-
-    Returns:
-    True if the date is in a valid format, False otherwise.
-    """
-    pattern = r"^(0[1-9]|1[0-2])/(0[1-9]|[12][0-9]|3[01])/(19|20)\d{2}$"
-    return re.match(pattern, date_string) is not None
-
-
-def convert_american_date_to_normal(date: str):
-    """
-    Convert an American date format (MM/DD/YYYY) to a normal date format (DD/MM/YYYY).
-
-    Parameters:
-    - date: American date string.
-
-    Returns:
-    Date string in normal format.
-    """
-    date_split = date.split("/")
-    return f"{date_split[1]}/{date_split[0]}/{date_split[2]}"
-
-
 def parse_table(
     df: pd.DataFrame,
     stations,
@@ -216,6 +419,7 @@ def parse_table(
     progress_var,
     percentage_label,
     status_label,
+    kit_ids=None,
 ):
     # TODO: check if there is option to make the program more efficient by adding kit id to the data that is returned.
 
@@ -224,91 +428,90 @@ def parse_table(
 
     Parameters:
     - df: Pandas DataFrame containing table data.
-    - stations: List of environmental stations.
+    - stations: List of environmental stations, or their StationIndex.
     - radius: Maximum distance for station inclusion.
     - progress_var: Tkinter variable for tracking progress.
     - percentage_label: Tkinter label for displaying progress percentage.
     - status_label: Tkinter label for displaying status messages.
+    - kit_ids: Ids of the merged kits, taken from the merged data directory if not provided.
 
     Returns:
     List of dictionaries representing parsed samples.
     """
     status_label.configure(text="Filtering meta data")
-    file_ids = set()
-    num_of_files = sum([1 for _ in os.listdir("./kitDataMerger/merged_asv_data")])
-    count = 0
-    for filename in os.listdir("./kitDataMerger/merged_asv_data"):
-        if filename.startswith("S_") and filename.endswith(".csv"):
-            file_id = filename.split("_")[1]
-            file_ids.add(str(file_id))
-        progress = count / num_of_files
-        progress_var.set(progress)
-        percentage_label.configure(text=(("%.2f " % (progress * 100)) + "%"))
+    if kit_ids is not None:
+        file_ids = {str(kit_id) for kit_id in kit_ids}
+    else:
+        file_ids = set()
+        num_of_files = sum([1 for _ in os.listdir("./kitDataMerger/merged_asv_data")])
+        count = 0
+        for filename in os.listdir("./kitDataMerger/merged_asv_data"):
+            file_id = parse_merged_name(filename)
+            if file_id is not None and filename.endswith((".csv", ".parquet")):
+                file_ids.add(str(file_id))
+            progress = count / num_of_files
+            progress_var.set(progress)
+            percentage_label.configure(text=(("%.2f " % (progress * 100)) + "%"))
 
     df = df[df["Kit ID"].astype(str).isin(file_ids)]
 
     status_label.configure(text="Parsing Table")
-    samples = []
-    rows = df.iterrows()
-    number_of_rows = len(df.index)
-    progress_counter = 0
-    for index, row in rows:
-        dateTime = str(row["Date"]).split()
-        if not type(dateTime) is List or len(dateTime) == 1:
-            time = "12:00:00"
-            date = dateTime[0]
-        else:
-            time = dateTime[1]
-            date = dateTime[0]
 
-        if not is_valid_date(date):
-            logging.error(f"Date in Kit ID {row['Kit ID']} is not valid: {date}")
-            continue
-        else:
-            date = convert_american_date_to_normal(date)
-        date_split = date.split("/")
-        time_split = time.split(":")
-        dt = datetime(
-            year=int(date_split[2]),
-            month=int(date_split[1]),
-            day=int(date_split[0]),
-            hour=int(time_split[0]),
-            minute=int(time_split[1]),
-            second=int(time_split[2]),
-        )
-        if not pd.isna(row["Coordination"]):
-            cord = parse_cord(row["Coordination"])
-        data = {
+    # The date is the first word of the "Date" column, in the MM/DD/YYYY format.
+    # Only the date is used, the samples are always taken at 12:00:00
+    dates = df["Date"].astype(str).str.split().str[0]
+    parsed_dates = pd.to_datetime(
+        dates.where(dates.str.match(DATE_PATTERN, na=False)),
+        format="%m/%d/%Y",
+        errors="coerce",
+    )
+    valid = parsed_dates.notna()
+    for kit_id, date in zip(df.loc[~valid, "Kit ID"], dates[~valid]):
+        logging.error(f"Date in Kit ID {kit_id} is not valid: {date}")
+
+    df = df[valid]
+    sample_dates = parsed_dates[valid] + pd.Timedelta(hours=12)
+
+    # Israel is at +02:00 in winter (IST) and +03:00 in summer (IDT)
+    localized = sample_dates.dt.tz_localize("Israel")
+    offsets = sample_dates - localized.dt.tz_convert("UTC").dt.tz_localize(None)
+    timestamps = sample_dates.dt.strftime("%Y-%m-%dT%H:%M:00") + np.where(
+        offsets == pd.Timedelta(hours=2), "+02:00", "+03:00"
+    )
+
+    # A sample without coordinates takes the coordinates of the previous sample
+    cords = (
+        df["Coordination"]
+        .map(lambda cord: parse_cord(cord) if not pd.isna(cord) else None)
+        .ffill()
+    )
+
+    samples = [
+        {
             "index": index,
-            "date": dt,
-            "timestamp": round_timestamp(dt, get_timezone(dt)),
+            "date": date,
+            "timestamp": timestamp,
             "cord": cord,
-            "TD": row["TD"],
-            "TG": row["TG"],
-            "TDmin": row["TDmin"],
-            "TDmax": row["TDmax"],
-            "WSmax": row["WSmax"],
-            "WDmax": row["WDmax"],
-            "WS": row["WS"],
-            "WD": row["WD"],
-            "STDwd": row["STDwd"],
-            "Grad": row["Grad"],
-            "NIP": row["NIP"],
-            "DiffR": row["DiffR"],
-            "RH": row["RH"],
-            "Rain": row["Rain"],
+            **weather,
             "stations": [],
         }
-        for station in stations:
-            dis = distance(station, cord[0], cord[1])
-            if dis <= radius:
-                data["stations"].append(dict(id=station["stationId"], dis=dis))
-        data["stations"].sort(key=lambda a: a.get("dis"))
-        samples.append(data)
-        progress_counter += 1
-        progress = progress_counter / number_of_rows
-        progress_var.set(progress)
-        percentage_label.configure(text=(("%.2f " % (progress * 100)) + "%"))
+        for index, date, timestamp, cord, weather in zip(
+            df.index,
+            [date.to_pydatetime() for date in sample_dates],
+            timestamps,
+            cords,
+            df[WEATHER_COLUMNS].to_dict(orient="records"),
+        )
+    ]
+    progress_var.set(1)
+    percentage_label.configure(text=(("%.2f " % 100) + "%"))
+
+    # Find the stations of all the samples at once
+    for sample, sample_stations in zip(
+        samples,
+        nearby_stations([sample["cord"] for sample in samples], stations, radius),
+    ):
+        sample["stations"] = sample_stations
     return samples
 
 
@@ -318,6 +521,9 @@ def update_weather(
     progress_var,
     percentage_label,
     status_label,
+    kit_ids=None,
+    fetch_workers=FETCH_WORKERS,
+    provider=None,
 ):
     """
     Update weather information for samples in a CSV file.
@@ -328,18 +534,107 @@ def update_weather(
     - progress_var: Tkinter variable for tracking progress.
     - percentage_label: Tkinter label for displaying progress percentage.
     - status_label: Tkinter label for displaying status messages.
+    - kit_ids: Ids of the merged kits, taken from the merged data directory if not provided.
+    - fetch_workers: Maximum number of stations whose data is fetched at the same time.
+    - provider: WeatherProvider of the stations and observations, the IMS API if not provided.
+
+    Returns:
+    True if the weather information was saved as "meta_data_final.csv", False otherwise.
+    """
+    df = enrich_meta_data(
+        pd.read_csv(filepath_or_buffer=filepath),
+        radius,
+        progress_var,
+        percentage_label,
+        status_label,
+        kit_ids,
+        fetch_workers,
+        provider,
+    )
+    if df is None:
+        return False
+
+    mark_missing_weather(df).to_csv(
+        f"./kitDataMerger/meteorology/meta_data_final.csv",
+        index=False,
+        encoding="utf-16",
+    )
+    logging.info(
+        f'The file was saved in the same directory of the original file as "meta_data_final.csv"'
+    )
+    status_label.configure(text="")
+
+    return True
+
+
+def mark_missing_weather(df: pd.DataFrame):
+    """
+    Mark the weather values that were looked up but are missing with MISSING_WEATHER,
+    before the metadata is saved.
+
+    Parameters:
+    - df: Pandas DataFrame of the metadata, returned by enrich_meta_data.
+
+    Returns:
+    Copy of the DataFrame with the marked weather columns.
+    """
+    df = df.copy()
+    rows = df.index.isin(df.attrs.get(WEATHER_ROWS, []))
+    for column in WEATHER_COLUMNS:
+        missing = rows & df[column].isnull().to_numpy()
+        if missing.any():
+            df[column] = df[column].astype(object)
+            df.loc[missing, column] = MISSING_WEATHER
+    return df
+
+
+def enrich_meta_data(
+    df: pd.DataFrame,
+    radius,
+    progress_var,
+    percentage_label,
+    status_label,
+    kit_ids=None,
+    fetch_workers=FETCH_WORKERS,
+    provider=None,
+):
+    """
+    Add the weather information of each sample to the metadata, in memory.
+
+    Parameters:
+    - df: Pandas DataFrame of the metadata.
+    - radius: Maximum distance for station inclusion.
+    - progress_var: Tkinter variable for tracking progress.
+    - percentage_label: Tkinter label for displaying progress percentage.
+    - status_label: Tkinter label for displaying status messages.
+    - kit_ids: Ids of the merged kits, taken from the merged data directory if not provided.
+    - fetch_workers: Maximum number of stations whose data is fetched at the same time.
+    - provider: WeatherProvider of the stations and observations, the IMS API if not provided.
 
     Returns:
-    None
+    Pandas DataFrame of the metadata with the weather columns, or None if the weather
+    information could not be retrieved. The missing values are left empty, the rows whose
+    weather was looked up are listed in its attrs, see mark_missing_weather.
     """
+    stats.reset()
+    if provider is None:
+        provider = IMSProvider()
     try:
-        stations = get_stations_json()
+        stations = provider.stations()
     except req.exceptions.SSLError:
         status_label.configure(text="There was an error with SSL.")
-        showerror("SSL error", "There is an error with SSL.")
-        return False
+        report_error(status_label, "SSL error", "There is an error with SSL.")
+        return None
+    except ConnectionError as e:
+        logging.error("Connection error: Could not get the stations of the Israeli Meteorologic Services.")
+        report_error(status_label, "Connection Error", f"There was a problem with connection to the Israeli Meteorologic Services.\n{e}")
+        return None
+    except req.exceptions.RequestException as e:
+        # e.g. a timeout, or an error status that is left after the retries
+        logging.error(f"Request error: Could not get the stations of the Israeli Meteorologic Services: {e}")
+        report_error(status_label, "Request Error", f"The stations of the Israeli Meteorologic Services could not be retrieved.\n{e}")
+        return None
 
-    df = pd.read_csv(filepath_or_buffer=filepath)
     if (
         "TD" not in df.columns
         and "TDmin" not in df.columns
@@ -381,177 +676,110 @@ def update_weather(
 
     df = df.sort_values(by="Date", ascending=True)
     samples = parse_table(
-        df, stations, radius, progress_var, percentage_label, status_label
+        df, stations, radius, progress_var, percentage_label, status_label, kit_ids
     )
+    looked_up = {}
+    # The values of the samples' timestamps that were fetched from each station, so a station
+    # is not asked again for a day in a later round
+    fetched = {}
+    # The stations without any of the weather channels have nothing to give
+    with_weather = stations.with_channels(WEATHER_CHANNELS)
+    skipped = {station["stationId"] for station in stations.stations} - {
+        station["stationId"] for station in with_weather.stations
+    }
+    round_number = 0
     while True:
+        # Group the samples that still miss weather by the next station they can get it from
         samples = sort_samples(samples, progress_var, percentage_label, status_label)
+        # Stop if there is no sample left with a station to get its information from
+        if not samples:
+            break
+        round_number += 1
         status_label.configure(text="Getting Information")
-        number_of_samples = len(samples)
-        progress_counter = 0
-        progress = progress_counter / number_of_samples
-        progress_var.set(progress)
-        percentage_label.configure(text=(("%.2f " % (progress * 100)) + "%"))
-        for station_id in samples.keys():
-            samples[station_id] = sorted(
-                samples[station_id], key=lambda data: data["date"]
+        progress_var.set(0)
+        percentage_label.configure(text=(("%.2f " % 0) + "%"))
+
+        # Fetch only the days that were not fetched from the stations yet, concurrently
+        station_days = plan_fetches(samples, fetched, skipped)
+        try:
+            responses = fetch_stations_data(
+                station_days, fetch_workers, progress_var, percentage_label, provider
             )
-            last_date = next_day(samples[station_id][-1]["date"])
-            params = {
-                "from": f'{samples[station_id][0]["date"].year}/{str(samples[station_id][0]["date"].month).zfill(2)}/{str(samples[station_id][0]["date"].day).zfill(2)}',
-                "to": f"{last_date.year}/{str(last_date.month).zfill(2)}/{str(last_date.day).zfill(2)}",
-            }
-            try:
-                response = req.get(
-                    url=f"https://api.ims.gov.il/v1/envista/stations/{station_id}/data",
-                    params=params,
-                    headers=headers,
-                    verify=certifi.where(),
-                )
-            except ConnectionError as e:
-                logging.error("Connection error: There was a problem with connection to the Israeli Meteorologic Services.")
-                showerror("Connection Error", f"There was a problem with connection to the Israeli Meteorologic Services.\n{e}")
-                return False
-            except Exception as e:
-                logging.error("Error: Something went wrong while getting meteorologic data.")
-                showerror(f"Something went wrong", "Something went wrong while getting meteorologic data.\n{e}")
-                return False
-            if response.status_code == 200:
-                response = response.json()
+        except ConnectionError as e:
+            logging.error("Connection error: There was a problem with connection to the Israeli Meteorologic Services.")
+            report_error(status_label, "Connection Error", f"There was a problem with connection to the Israeli Meteorologic Services.\n{e}")
+            return None
+        except Exception as e:
+            logging.error("Error: Something went wrong while getting meteorologic data.")
+            report_error(status_label, f"Something went wrong", "Something went wrong while getting meteorologic data.\n{e}")
+            return None
+
+        # Keep only the values of the samples' timestamps, a station that failed can be asked again
+        for station_id, observations in responses.items():
+            if observations is not None:
+                index = index_observations(observations)
+                known = fetched.setdefault(station_id, {})
                 for sample in samples[station_id]:
-                    if (
-                        pd.isnull(sample["TD"])
-                        or pd.isnull(sample["TDmin"])
-                        or pd.isnull(sample["TDmax"])
-                        or pd.isnull(sample["TG"])
-                        or pd.isnull(sample["WSmax"])
-                        or pd.isnull(sample["WDmax"])
-                        or pd.isnull(sample["WS"])
-                        or pd.isnull(sample["WD"])
-                        or pd.isnull(sample["STDwd"])
-                        or pd.isnull(sample["Grad"])
-                        or pd.isnull(sample["NIP"])
-                        or pd.isnull(sample["DiffR"])
-                        or pd.isnull(sample["RH"])
-                        or pd.isnull(sample["Rain"])
-                    ):
-                        for data in response["data"]:
-                            if data["datetime"] == sample["timestamp"]:
-                                for channel in data["channels"]:
-                                    if (
-                                        channel["name"] == "TD"
-                                        or channel["name"] == "TDmin"
-                                        or channel["name"] == "TDmax"
-                                        or channel["name"] == "TG"
-                                        or channel["name"] == "WSmax"
-                                        or channel["name"] == "WDmax"
-                                        or channel["name"] == "WS"
-                                        or channel["name"] == "TG"
-                                        or channel["name"] == "WD"
-                                        or channel["name"] == "STDwd"
-                                        or channel["name"] == "Grad"
-                                        or channel["name"] == "NIP"
-                                        or channel["name"] == "DiffR"
-                                        or channel["name"] == "RH"
-                                        or channel["name"] == "Rain"
-                                    ) and channel["valid"]:
-                                        sample[channel["name"]] = channel["value"]
-            progress_counter += 1
-            progress = progress_counter / number_of_samples
-            progress_var.set(progress)
-            percentage_label.configure(text=(("%.2f " % (progress * 100)) + "%"))
+                    if sample["timestamp"] not in known:
+                        known[sample["timestamp"]] = index.get(sample["timestamp"], {})
 
-        length = sum([len(samples[station_id]) for station_id in samples])
-        status_label.configure(text="Updating")
-        progress_counter = 0
-        for station_id in samples:
+        # Apply the data in the order of the stations, like a sequential run would
+        for station_id in samples.keys():
+            known = fetched.get(station_id, {})
             for sample in samples[station_id]:
-                df.at[sample["index"], "TD"] = (
-                    sample["TD"] if not pd.isnull(sample["TD"]) else "__"
-                )
-                df.at[sample["index"], "TDmin"] = (
-                    sample["TDmin"] if not pd.isnull(sample["TDmin"]) else "__"
-                )
-                df.at[sample["index"], "TDmax"] = (
-                    sample["TDmax"] if not pd.isnull(sample["TDmax"]) else "__"
-                )
-                df.at[sample["index"], "TG"] = (
-                    sample["TG"] if not pd.isnull(sample["TG"]) else "__"
-                )
-                df.at[sample["index"], "WSmax"] = (
-                    sample["WSmax"] if not pd.isnull(sample["WSmax"]) else "__"
-                )
-                df.at[sample["index"], "WDmax"] = (
-                    sample["WDmax"] if not pd.isnull(sample["WDmax"]) else "__"
-                )
-                df.at[sample["index"], "WS"] = (
-                    sample["WS"] if not pd.isnull(sample["WS"]) else "__"
-                )
-                df.at[sample["index"], "WD"] = (
-                    sample["WD"] if not pd.isnull(sample["WD"]) else "__"
-                )
-                df.at[sample["index"], "STDwd"] = (
-                    sample["STDwd"] if not pd.isnull(sample["STDwd"]) else "__"
-                )
-                df.at[sample["index"], "Grad"] = (
-                    sample["Grad"] if not pd.isnull(sample["Grad"]) else "__"
-                )
-                df.at[sample["index"], "NIP"] = (
-                    sample["NIP"] if not pd.isnull(sample["NIP"]) else "__"
-                )
-                df.at[sample["index"], "DiffR"] = (
-                    sample["DiffR"] if not pd.isnull(sample["DiffR"]) else "__"
-                )
-                df.at[sample["index"], "RH"] = (
-                    sample["RH"] if not pd.isnull(sample["RH"]) else "__"
-                )
-                df.at[sample["index"], "Rain"] = (
-                    sample["Rain"] if not pd.isnull(sample["Rain"]) else "__"
-                )
-                progress_counter += 1
-                progress = progress_counter / length
-                progress_var.set(progress)
-                percentage_label.configure(text=(("%.2f " % (progress * 100)) + "%"))
+                looked_up[sample["index"]] = sample
+                if (
+                    pd.isnull(sample["TD"])
+                    or pd.isnull(sample["TDmin"])
+                    or pd.isnull(sample["TDmax"])
+                    or pd.isnull(sample["TG"])
+                    or pd.isnull(sample["WSmax"])
+                    or pd.isnull(sample["WDmax"])
+                    or pd.isnull(sample["WS"])
+                    or pd.isnull(sample["WD"])
+                    or pd.isnull(sample["STDwd"])
+                    or pd.isnull(sample["Grad"])
+                    or pd.isnull(sample["NIP"])
+                    or pd.isnull(sample["DiffR"])
+                    or pd.isnull(sample["RH"])
+                    or pd.isnull(sample["Rain"])
+                ):
+                    sample.update(known.get(sample["timestamp"], {}))
 
+        # The samples without any weather fall back to their next station
         empty_samples = []
-        status_label.configure(text="Collecting samples that haven't been updated")
-        length = sum([len(samples[station_id]) for station_id in samples])
-        progress_counter = 0
         for station_id in samples:
             for sample in samples[station_id]:
-                if (
-                    pd.isnull(sample["TD"])
-                    and pd.isnull(sample["TDmin"])
-                    and pd.isnull(sample["TDmax"])
-                    and pd.isnull(sample["TG"])
-                    and pd.isnull(sample["WSmax"])
-                    and pd.isnull(sample["WDmax"])
-                    and pd.isnull(sample["WS"])
-                    and pd.isnull(sample["WD"])
-                    and pd.isnull(sample["STDwd"])
-                    and pd.isnull(sample["Grad"])
-                    and pd.isnull(sample["NIP"])
-                    and pd.isnull(sample["DiffR"])
-                    and pd.isnull(sample["RH"])
-                    and pd.isnull(sample["Rain"])
-                ):
+                if all(pd.isnull(sample[column]) for column in WEATHER_COLUMNS):
                     _ = sample["stations"].pop(0)
                     if sample["stations"]:
                         empty_samples.append(sample)
-                progress_counter += 1
-                progress = progress_counter / length
-                progress_var.set(progress)
-                percentage_label.configure(text=(("%.2f " % (progress * 100)) + "%"))
+
+        logging.info(
+            f"Weather round {round_number}: {sum(len(station_samples) for station_samples in samples.values())} samples, "
+            f"{len(station_days)} stations fetched, {sum(len(days) for days in station_days.values())} station days, "
+            f"{len(empty_samples)} samples left for the next stations"
+        )
         if not empty_samples:
             break
         samples = empty_samples
-    df.to_csv(
-        f"./kitDataMerger/meteorology/meta_data_final.csv",
-        index=False,
-        encoding="utf-16",
-    )
-    logging.info(
-        f'The file was saved in the same directory of the original file as "meta_data_final.csv"'
-    )
-    status_label.configure(text="")
 
-    return True
+    # Write the weather of all the looked up samples at once, the columns stay numeric
+    status_label.configure(text="Updating")
+    if looked_up:
+        df.update(
+            pd.DataFrame.from_records(
+                [
+                    [sample[column] for column in WEATHER_COLUMNS]
+                    for sample in looked_up.values()
+                ],
+                index=list(looked_up),
+                columns=WEATHER_COLUMNS,
+            )
+        )
+    df.attrs[WEATHER_ROWS] = list(looked_up)
+
+    # Log how long the requests to the IMS took
+    log_stats()
+
+    return df
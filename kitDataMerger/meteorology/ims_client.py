@@ -0,0 +1,206 @@
+import os
+
+import time
+import logging
+import threading
+from typing import NamedTuple
+
+import certifi
+import dotenv
+import requests as req
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Load environment variables from a .env file, before the API key is read
+dotenv.load_dotenv(dotenv.find_dotenv())
+
+IMS_API_URL = "https://api.ims.gov.il/v1/envista"
+
+# Responses that are worth retrying: too many requests and server errors
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Default retry policy: up to 5 retries, waiting 0.5, 1, 2, 4... seconds between them
+# (or as long as the Retry-After header says)
+DEFAULT_RETRIES = 5
+DEFAULT_BACKOFF_FACTOR = 0.5
+
+# Seconds to wait for the connection and for the response
+DEFAULT_TIMEOUT = (10, 120)
+
+# Number of connections kept alive for the IMS host
+DEFAULT_POOL_SIZE = 10
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class RequestTiming(NamedTuple):
+    """
+    The timing of a single request to the IMS API.
+
+    Fields:
+    - url: URL of the request.
+    - status: Status code of the final response, None if no response was received.
+    - attempts: Number of attempts, including the retries.
+    - seconds: Total time of the request, including the retries and the waits between them.
+    """
+
+    url: str
+    status: int
+    attempts: int
+    seconds: float
+
+
+class RequestStats:
+    """
+    Collect the timings of the requests to the IMS API.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.timings = []
+
+    def add(self, timing: RequestTiming):
+        with self._lock:
+            self.timings.append(timing)
+
+    def reset(self):
+        with self._lock:
+            self.timings = []
+
+    def summary(self):
+        """
+        Summarize the collected timings.
+
+        Returns:
+        Dictionary with the number of requests, retries and failures, and the total, mean
+        and max seconds of the requests.
+        """
+        with self._lock:
+            timings = list(self.timings)
+        seconds = [timing.seconds for timing in timings]
+        return {
+            "requests": len(timings),
+            "retries": sum(timing.attempts - 1 for timing in timings),
+            "failures": sum(
+                1 for timing in timings if timing.status is None or timing.status >= 400
+            ),
+            "total_seconds": sum(seconds),
+            "mean_seconds": sum(seconds) / len(seconds) if seconds else 0,
+            "max_seconds": max(seconds, default=0),
+        }
+
+
+# The timings of all the requests made through ims_get
+stats = RequestStats()
+
+
+def create_session(
+    retries=DEFAULT_RETRIES,
+    backoff_factor=DEFAULT_BACKOFF_FACTOR,
+    pool_size=DEFAULT_POOL_SIZE,
+):
+    """
+    Create a session for the IMS API, which keeps its connections alive and retries
+    the failed requests with an exponential backoff.
+
+    Parameters:
+    - retries: Maximum number of retries of a request.
+    - backoff_factor: Backoff factor of the retries, the n-th retry waits backoff_factor * 2^(n-1) seconds.
+    - pool_size: Number of connections kept alive.
+
+    Returns:
+    requests.Session object.
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=["GET"],
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size
+    )
+
+    session = req.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.verify = certifi.where()
+    session.headers.update({"Authorization": os.environ.get("API_KEY")})
+    return session
+
+
+def get_session():
+    """
+    Get the shared session of the IMS API, and create it on the first call.
+
+    Returns:
+    requests.Session object.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = create_session()
+        return _session
+
+
+def configure_session(**kwargs):
+    """
+    Replace the shared session of the IMS API with a new one.
+
+    Parameters:
+    - kwargs: Arguments of create_session (retries, backoff_factor, pool_size).
+
+    Returns:
+    None
+    """
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = create_session(**kwargs)
+
+
+def ims_get(url, params=None, timeout=DEFAULT_TIMEOUT, headers=None):
+    """
+    Make a GET request to the IMS API through the shared session, and record its timing.
+
+    Parameters:
+    - url: URL for the GET request.
+    - params: Optional parameters for the request.
+    - timeout: Seconds to wait for the connection and for the response.
+    - headers: Optional headers for the request, in addition to the session's headers.
+
+    Returns:
+    requests.Response of the final attempt. Raises requests exceptions if no response was received.
+    """
+    start = time.perf_counter()
+    status = None
+    attempts = 1
+    try:
+        response = get_session().get(
+            url, params=params, timeout=timeout, headers=headers
+        )
+        status = response.status_code
+        if response.raw is not None and response.raw.retries is not None:
+            attempts += len(response.raw.retries.history)
+        return response
+    finally:
+        stats.add(RequestTiming(url, status, attempts, time.perf_counter() - start))
+
+
+def log_stats():
+    """
+    Log the summary of the requests made since the last reset of the stats.
+
+    Returns:
+    None
+    """
+    summary = stats.summary()
+    logging.info(
+        f"IMS requests: {summary['requests']} requests, {summary['retries']} retries, "
+        f"{summary['failures']} failures, {summary['total_seconds']:.2f}s total, "
+        f"{summary['mean_seconds']:.2f}s mean, {summary['max_seconds']:.2f}s max"
+    )
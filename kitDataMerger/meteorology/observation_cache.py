@@ -0,0 +1,216 @@
+import os
+
+import json
+import time
+import zlib
+import sqlite3
+import threading
+from pathlib import Path
+from datetime import date, datetime, timedelta
+
+import pytz
+
+# The observations are kept with the other caches of the program
+CACHE_PATH = "./kitDataMerger/cache/ims_observations.sqlite"
+
+# Maximum size of the cached observations, the least recently used days are evicted above it
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+
+# A day is only cached once it is complete: it ended at least this long ago (in Israel time)
+COMPLETE_AFTER = timedelta(days=1)
+
+
+def complete_before():
+    """
+    Get the first day that is not complete yet.
+
+    Returns:
+    Date object, the days before it are complete and can be cached.
+    """
+    return (datetime.now(pytz.timezone("Israel")) - COMPLETE_AFTER).date()
+
+
+class ObservationCache:
+    """
+    A persistent SQLite cache of the IMS station observations, per station and day.
+
+    The observations of a day are saved as compressed JSON, in the format of the "data" list of
+    the IMS API. A day without observations is not cached: the IMS may publish its observations
+    later, so it is requested again on the next run. The cache is safe to use from several
+    threads.
+
+    A read-only cache never writes to its database, e.g. a recorded weather archive: the days
+    that are read are not marked as used, and nothing can be put in it.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_bytes=MAX_CACHE_BYTES, read_only=False):
+        """
+        Parameters:
+        - path: Path of the SQLite database, it is created on the first use.
+        - max_bytes: Maximum size of the cached observations, None does not limit it.
+        - read_only: Whether the database is only read, it is then opened in read-only mode.
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.read_only = read_only
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self):
+        if self.read_only:
+            # The database may be on read-only media, so it is opened without any writes
+            return sqlite3.connect(
+                f"{Path(self.path).resolve().as_uri()}?mode=ro", uri=True, timeout=30
+            )
+        connection = sqlite3.connect(self.path, timeout=30)
+        if not self._initialized:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS observations ("
+                "station_id INTEGER NOT NULL, "
+                "day TEXT NOT NULL, "
+                "data BLOB NOT NULL, "
+                "size INTEGER NOT NULL, "
+                "last_used REAL NOT NULL, "
+                "PRIMARY KEY (station_id, day))"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS observations_last_used ON observations (last_used)"
+            )
+            self._initialized = True
+        return connection
+
+    def get(self, station_id, days):
+        """
+        Get the cached observations of a station.
+
+        Parameters:
+        - station_id: Id of the station.
+        - days: List of date objects.
+
+        Returns:
+        Dictionary mapping each cached day to its list of observations.
+        """
+        if not days or not os.path.exists(self.path):
+            return {}
+        keys = [day.isoformat() for day in days]
+        cached = {}
+        with self._lock:
+            connection = self._connect()
+            try:
+                for start in range(0, len(keys), 500):
+                    chunk = keys[start : start + 500]
+                    rows = connection.execute(
+                        f"SELECT day, data FROM observations WHERE station_id = ? "
+                        f"AND day IN ({', '.join('?' * len(chunk))})",
+                        [station_id, *chunk],
+                    ).fetchall()
+                    for day, data in rows:
+                        observations = json.loads(zlib.decompress(data))
+                        # Older caches saved the days without observations, they are
+                        # requested again
+                        if observations:
+                            cached[date.fromisoformat(day)] = observations
+                if cached and not self.read_only:
+                    # Remember when the days were used, for the eviction
+                    now = time.time()
+                    connection.executemany(
+                        "UPDATE observations SET last_used = ? WHERE station_id = ? AND day = ?",
+                        [(now, station_id, day.isoformat()) for day in cached],
+                    )
+                    connection.commit()
+            finally:
+                connection.close()
+        return cached
+
+    def put(self, station_id, observations_by_day, complete_only=True):
+        """
+        Cache the observations of a station, and evict the least recently used days if the
+        cache grew too big. The days without observations are not cached.
+
+        Parameters:
+        - station_id: Id of the station.
+        - observations_by_day: Dictionary mapping each day (date object) to its list of observations.
+        - complete_only: Whether only the complete days are cached.
+
+        Returns:
+        None. Raises ValueError if the cache is read-only.
+        """
+        if self.read_only:
+            raise ValueError(f"The observation cache {self.path} is read-only")
+        first_incomplete_day = complete_before()
+        now = time.time()
+        rows = []
+        for day, observations in observations_by_day.items():
+            if not observations or (complete_only and day >= first_incomplete_day):
+                continue
+            data = zlib.compress(json.dumps(observations).encode("utf-8"))
+            rows.append((station_id, day.isoformat(), data, len(data), now))
+        if not rows:
+            return
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._lock:
+            connection = self._connect()
+            try:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO observations VALUES (?, ?, ?, ?, ?)", rows
+                )
+                connection.commit()
+                self._evict(connection)
+            finally:
+                connection.close()
+
+    def _evict(self, connection):
+        # Remove the least recently used days until the cache is back under 90% of its size
+        if self.max_bytes is None:
+            return
+        total = connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM observations"
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = total - int(self.max_bytes * 0.9)
+        evicted = []
+        for station_id, day, size in connection.execute(
+            "SELECT station_id, day, size FROM observations ORDER BY last_used"
+        ):
+            if target <= 0:
+                break
+            evicted.append((station_id, day))
+            target -= size
+        connection.executemany(
+            "DELETE FROM observations WHERE station_id = ? AND day = ?", evicted
+        )
+        connection.commit()
+
+    def size(self):
+        """
+        Get the size of the cached observations.
+
+        Returns:
+        Size in bytes.
+        """
+        if not os.path.exists(self.path):
+            return 0
+        with self._lock:
+            connection = self._connect()
+            try:
+                return connection.execute(
+                    "SELECT COALESCE(SUM(size), 0) FROM observations"
+                ).fetchone()[0]
+            finally:
+                connection.close()
+
+    def clear(self):
+        """
+        Remove all the cached observations.
+
+        Returns:
+        None. Raises ValueError if the cache is read-only.
+        """
+        if self.read_only:
+            raise ValueError(f"The observation cache {self.path} is read-only")
+        with self._lock:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self._initialized = False
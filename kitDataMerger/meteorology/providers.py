@@ -0,0 +1,126 @@
+import os
+
+import json
+import threading
+from abc import ABC, abstractmethod
+from datetime import date
+
+from .observation_cache import ObservationCache
+from .station_catalogue import build_station_index
+
+# Files of a weather archive directory
+ARCHIVE_STATIONS = "stations.json"
+ARCHIVE_OBSERVATIONS = "observations.sqlite"
+
+
+class WeatherProvider(ABC):
+    """
+    A source of the stations and their observations for the weather stage.
+
+    Subclasses implement stations and fetch. fetch is called from several threads at once.
+    """
+
+    @abstractmethod
+    def stations(self):
+        """
+        Get the stations.
+
+        Returns:
+        StationIndex of the stations.
+        """
+
+    @abstractmethod
+    def fetch(self, station_id, days):
+        """
+        Fetch the observations of a station.
+
+        Parameters:
+        - station_id: Id of the station.
+        - days: Sorted list of the days (date objects) to fetch.
+
+        Returns:
+        List of the observations of the days, in the format of the "data" list of the IMS API,
+        or None if the station's data could not be retrieved.
+        """
+
+
+class ReplayProvider(WeatherProvider):
+    """
+    Serve the stations and observations from a recorded weather archive, without the network.
+
+    The archive is a directory with the station list ("stations.json", in the format of the
+    IMS API) and the observations per station and day ("observations.sqlite", in the format of
+    ObservationCache). A day that is not in the archive has no observations. The archive is
+    only read, so it can be replayed from read-only media.
+    """
+
+    def __init__(self, archive):
+        """
+        Parameters:
+        - archive: Path of the archive directory, see RecordingProvider to record one.
+        """
+        stations_path = os.path.join(archive, ARCHIVE_STATIONS)
+        if not os.path.exists(stations_path):
+            raise FileNotFoundError(f"There is no weather archive in {archive}")
+        self.archive = archive
+        self.observations = ObservationCache(
+            os.path.join(archive, ARCHIVE_OBSERVATIONS), max_bytes=None, read_only=True
+        )
+        self._index = None
+
+    def stations(self):
+        if self._index is None:
+            with open(os.path.join(self.archive, ARCHIVE_STATIONS), encoding="utf-8") as file:
+                self._index = build_station_index(json.load(file))
+        return self._index
+
+    def fetch(self, station_id, days):
+        observations = self.observations.get(station_id, days)
+        return [
+            observation for day in days for observation in observations.get(day, [])
+        ]
+
+
+class RecordingProvider(WeatherProvider):
+    """
+    Record the stations and observations of another provider to a weather archive, which can
+    then be replayed with ReplayProvider. Recording again to the same archive adds to it.
+    """
+
+    def __init__(self, provider, archive):
+        """
+        Parameters:
+        - provider: WeatherProvider to record, e.g. IMSProvider.
+        - archive: Path of the archive directory, it is created if it does not exist.
+        """
+        os.makedirs(archive, exist_ok=True)
+        self.provider = provider
+        self.archive = archive
+        self.observations = ObservationCache(
+            os.path.join(archive, ARCHIVE_OBSERVATIONS), max_bytes=None
+        )
+        self._lock = threading.Lock()
+
+    def stations(self):
+        index = self.provider.stations()
+        with self._lock:
+            with open(
+                os.path.join(self.archive, ARCHIVE_STATIONS), "w", encoding="utf-8"
+            ) as file:
+                json.dump(index.stations, file)
+        return index
+
+    def fetch(self, station_id, days):
+        observations = self.provider.fetch(station_id, days)
+        if observations is None:
+            return None
+
+        # Record the observations of each requested day, the days without observations are
+        # not recorded (they have no observations when replayed either)
+        by_day = {day: [] for day in days}
+        for observation in observations:
+            day = date.fromisoformat(observation["datetime"][:10])
+            if day in by_day:
+                by_day[day].append(observation)
+        self.observations.put(station_id, by_day, complete_only=False)
+        return observations
@@ -0,0 +1,280 @@
+import os
+
+import json
+import time
+import logging
+import hashlib
+from typing import List, NamedTuple
+
+import numpy as np
+import requests as req
+
+from .ims_client import IMS_API_URL, ims_get
+
+# The station list is kept with the other caches of the program
+CATALOGUE_PATH = "./kitDataMerger/cache/ims_stations.json"
+INDEX_PATH = "./kitDataMerger/cache/ims_stations_index.npz"
+
+# The station list changes very rarely, it is only revalidated with the IMS after this many seconds
+CATALOGUE_TTL = 7 * 24 * 60 * 60
+
+
+class StationIndex(NamedTuple):
+    """
+    The locations and channels of the stations, as arrays for calculating the distances
+    to all the stations at once.
+
+    Fields:
+    - stations: List of the stations that have a location, in the order of the arrays.
+    - latitudes: Latitudes of the stations, in radians.
+    - longitudes: Longitudes of the stations, in radians.
+    - channel_names: Names of all the channels of the stations.
+    - channels: Boolean matrix, whether each station (row) has each channel (column).
+    - listed: Whether the channels of each station are known, a station without a "monitors"
+        list might have any channel.
+    """
+
+    stations: List[dict]
+    latitudes: np.ndarray
+    longitudes: np.ndarray
+    channel_names: np.ndarray
+    channels: np.ndarray
+    listed: np.ndarray
+
+    def with_channels(self, names):
+        """
+        Select the stations that have at least one of the given channels.
+
+        Parameters:
+        - names: Names of the channels.
+
+        Returns:
+        StationIndex of the selected stations.
+        """
+        columns = np.isin(self.channel_names, list(names))
+        selected = ~self.listed | self.channels[:, columns].any(axis=1)
+        return StationIndex(
+            [station for station, keep in zip(self.stations, selected) if keep],
+            self.latitudes[selected],
+            self.longitudes[selected],
+            self.channel_names,
+            self.channels[selected],
+            self.listed[selected],
+        )
+
+
+def build_station_index(stations):
+    """
+    Build the index of the stations, stations without a location are left out.
+
+    Parameters:
+    - stations: List of environmental stations, in the format of the IMS API.
+
+    Returns:
+    StationIndex of the stations.
+    """
+    located = []
+    for position, station in enumerate(stations):
+        try:
+            located.append(
+                (
+                    position,
+                    float(station["location"]["latitude"]),
+                    float(station["location"]["longitude"]),
+                )
+            )
+        except (TypeError, KeyError, ValueError):
+            continue
+    positions = [position for position, _, _ in located]
+
+    monitors = [stations[position].get("monitors") for position in positions]
+    channel_names = sorted(
+        {
+            monitor["name"]
+            for station_monitors in monitors
+            for monitor in station_monitors or []
+        }
+    )
+    columns = {name: column for column, name in enumerate(channel_names)}
+    channels = np.zeros((len(positions), len(channel_names)), dtype=bool)
+    for row, station_monitors in enumerate(monitors):
+        for monitor in station_monitors or []:
+            channels[row, columns[monitor["name"]]] = True
+
+    return _make_index(
+        stations,
+        np.array(positions, dtype=np.int64),
+        np.radians(np.array([lat for _, lat, _ in located], dtype=float)),
+        np.radians(np.array([lon for _, _, lon in located], dtype=float)),
+        np.array(channel_names, dtype=str),
+        channels,
+        np.array([station_monitors is not None for station_monitors in monitors]),
+    )
+
+
+def _make_index(
+    stations, positions, latitudes, longitudes, channel_names, channels, listed
+):
+    # The stations are kept in the catalogue, the index only refers to their positions
+    return StationIndex(
+        [stations[position] for position in positions],
+        latitudes,
+        longitudes,
+        channel_names,
+        channels.reshape(len(positions), len(channel_names)),
+        listed,
+    )
+
+
+class StationCatalogue:
+    """
+    The list of the IMS stations, cached on disk with its spatial index.
+
+    The list is only requested again when it is older than the TTL, and then it is revalidated
+    with its ETag, so an unchanged list is not downloaded again. If the IMS cannot be reached,
+    a cached list is used even when it is older than the TTL.
+    """
+
+    def __init__(
+        self, path=CATALOGUE_PATH, index_path=INDEX_PATH, ttl=CATALOGUE_TTL, url=None
+    ):
+        """
+        Parameters:
+        - path: Path of the cached station list, it is created on the first use.
+        - index_path: Path of the cached spatial index.
+        - ttl: Seconds a cached station list is used without asking the IMS.
+        - url: URL of the station list, the "stations" endpoint of the IMS API if not provided.
+        """
+        self.url = url if url is not None else f"{IMS_API_URL}/stations"
+        self.path = path
+        self.index_path = index_path
+        self.ttl = ttl
+        self._catalogue = None
+        self._index = None
+
+    def stations(self):
+        """
+        Get the list of the stations, from the cache if it is fresh.
+
+        Returns:
+        List of environmental stations, in the format of the IMS API.
+        """
+        return self._load()["stations"]
+
+    def index(self):
+        """
+        Get the spatial index of the stations, it is only built again when the list changed.
+
+        Returns:
+        StationIndex of the stations.
+        """
+        catalogue = self._load()
+        if self._index is not None and self._index[0] == catalogue["digest"]:
+            return self._index[1]
+
+        index = self._read_index(catalogue)
+        if index is None:
+            index = build_station_index(catalogue["stations"])
+            self._write_index(catalogue, index)
+        self._index = (catalogue["digest"], index)
+        return index
+
+    def clear(self):
+        """
+        Remove the cached station list and index.
+
+        Returns:
+        None
+        """
+        for path in (self.path, self.index_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self._catalogue = None
+        self._index = None
+
+    def _load(self):
+        if self._catalogue is None and os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as file:
+                self._catalogue = json.load(file)
+        if (
+            self._catalogue is not None
+            and time.time() - self._catalogue["fetched"] < self.ttl
+        ):
+            return self._catalogue
+
+        # The cached list is missing or stale, ask the IMS if it changed
+        headers = {}
+        if self._catalogue is not None and self._catalogue.get("etag"):
+            headers["If-None-Match"] = self._catalogue["etag"]
+        try:
+            response = ims_get(self.url, headers=headers)
+            if response.status_code != 304:
+                response.raise_for_status()
+        except req.exceptions.RequestException as e:
+            if self._catalogue is None:
+                raise
+            logging.warning(
+                f"Could not refresh the IMS stations, using the cached list: {e}"
+            )
+            return self._catalogue
+
+        if response.status_code == 304:
+            self._catalogue["fetched"] = time.time()
+        else:
+            stations = response.json()
+            self._catalogue = {
+                "fetched": time.time(),
+                "etag": response.headers.get("ETag"),
+                "digest": hashlib.sha256(
+                    json.dumps(stations, sort_keys=True).encode("utf-8")
+                ).hexdigest(),
+                "stations": stations,
+            }
+        # Write to a temporary file first, so a crash never leaves a broken cache
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(f"{self.path}.tmp", "w", encoding="utf-8") as file:
+            json.dump(self._catalogue, file)
+        os.replace(f"{self.path}.tmp", self.path)
+        return self._catalogue
+
+    def _read_index(self, catalogue):
+        # The index is only used if it was built from the same station list
+        if not os.path.exists(self.index_path):
+            return None
+        try:
+            with np.load(self.index_path) as saved:
+                if str(saved["digest"]) != catalogue["digest"]:
+                    return None
+                return _make_index(
+                    catalogue["stations"],
+                    saved["positions"],
+                    saved["latitudes"],
+                    saved["longitudes"],
+                    saved["channel_names"],
+                    saved["channels"],
+                    saved["listed"],
+                )
+        except (OSError, KeyError, ValueError, IndexError):
+            return None
+
+    def _write_index(self, catalogue, index):
+        positions = {
+            id(station): position
+            for position, station in enumerate(catalogue["stations"])
+        }
+        os.makedirs(os.path.dirname(self.index_path) or ".", exist_ok=True)
+        with open(f"{self.index_path}.tmp", "wb") as file:
+            np.savez(
+                file,
+                digest=np.array(catalogue["digest"]),
+                positions=np.array(
+                    [positions[id(station)] for station in index.stations],
+                    dtype=np.int64,
+                ),
+                latitudes=index.latitudes,
+                longitudes=index.longitudes,
+                channel_names=index.channel_names,
+                channels=index.channels,
+                listed=index.listed,
+            )
+        os.replace(f"{self.index_path}.tmp", self.index_path)
@@ -0,0 +1,229 @@
+import logging
+
+import pandas as pd
+
+from .data_filter import filter
+from .file_merger import SAMPLES, merge_frames
+from .manifest import scan_samples
+from .meta_data_merger import join_meta_data
+from .meteorology.get_weather import (
+    FETCH_WORKERS,
+    enrich_meta_data,
+    mark_missing_weather,
+)
+from .storage import (
+    MERGED_CSV_OPTIONS,
+    PUBLIC_CSV_OPTIONS,
+    check_format,
+    clear_kit_files,
+    export_public,
+    kit_files,
+    run_tasks,
+    write_frames,
+)
+
+# The stages whose outputs can be saved to their work directory
+CHECKPOINTS = ["merged", "meta", "public"]
+
+
+class Pipeline:
+    """
+    Run the filter, merge, weather and metadata stages, passing the data between them in memory.
+
+    Nothing is written to the work directories, unless the stage is a checkpoint:
+    - "merged": the merged data is saved to "./kitDataMerger/merged_asv_data".
+    - "meta": the metadata with the weather is saved to "./kitDataMerger/meteorology/meta_data_final.csv".
+    - "public": the public data is saved to "./kitDataMerger/microbiome-public".
+
+    Attributes (set by run):
+    - manifest: List of SampleFile entries of the selected files.
+    - merged: Dictionary mapping the merged filename of each kit to its DataFrame.
+    - meta: Pandas DataFrame of the metadata with the weather information, with numeric
+        weather columns (see mark_missing_weather).
+    - public: Dictionary mapping the public filename of each kit to its DataFrame.
+    """
+
+    def __init__(
+        self,
+        data_dir,
+        meta_path,
+        samples_type,
+        progress_var,
+        percentage_label,
+        status_label,
+        workers=1,
+        checkpoints=(),
+        kits=None,
+        file_format="csv",
+        fetch_workers=FETCH_WORKERS,
+        weather_provider=None,
+    ):
+        """
+        Parameters:
+        - data_dir: Directory of the samples (for fungi, a directory of seq folders).
+        - meta_path: Path of the metadata file.
+        - samples_type: "Fungi" or "Bacteria".
+        - progress_var: Tkinter variable for tracking progress.
+        - percentage_label: Tkinter label for displaying progress percentage.
+        - status_label: Tkinter label for displaying status messages.
+        - workers: Number of worker processes used to parse the files.
+        - checkpoints: The stages whose outputs are saved to their work directory (see CHECKPOINTS).
+        - kits: Ids of the kits to process, all the kits are processed if not provided.
+            The checkpoints of the other kits are kept as they are.
+        - file_format: File format of the merged and public checkpoints, "csv" or "parquet".
+        - fetch_workers: Maximum number of weather stations whose data is fetched at the same time.
+        - weather_provider: WeatherProvider of the weather stage, the IMS API if not provided.
+        """
+        check_format(file_format)
+        for checkpoint in checkpoints:
+            if checkpoint not in CHECKPOINTS:
+                raise ValueError(f"Unknown checkpoint: {checkpoint}")
+
+        self.data_dir = data_dir
+        self.meta_path = meta_path
+        self.samples_type = samples_type
+        self.progress_var = progress_var
+        self.percentage_label = percentage_label
+        self.status_label = status_label
+        self.workers = workers
+        self.checkpoints = set(checkpoints)
+        self.kits = kits
+        self.file_format = file_format
+        self.fetch_workers = fetch_workers
+        self.weather_provider = weather_provider
+
+        self.manifest = None
+        self.merged = None
+        self.meta = None
+        self.public = None
+
+    def run(self, manifest=None, weather_status_label=None):
+        """
+        Run all the stages.
+
+        Parameters:
+        - manifest: The sample files of the data directory, if it was already scanned.
+        - weather_status_label: Tkinter label for displaying the weather status messages,
+            the status label is used if not provided.
+
+        Returns:
+        True if the public data is ready, False if there were no files to merge or the weather
+        information could not be retrieved.
+        """
+        if manifest is None:
+            manifest = scan_samples(self.data_dir, self.samples_type)
+
+        # Select the sample files, the merge reads them straight from the data directory
+        self.manifest = filter(
+            self.data_dir,
+            self.progress_var,
+            self.percentage_label,
+            self.status_label,
+            self.samples_type,
+            staging="manifest",
+            manifest=manifest,
+            kits=self.kits,
+        )
+        if not self.manifest and self.kits is None:
+            return False
+
+        # Merge samples
+        self.merged = merge_frames(
+            self.progress_var,
+            self.percentage_label,
+            self.status_label,
+            self.samples_type,
+            workers=self.workers,
+            manifest=self.manifest,
+        )
+        if "merged" in self.checkpoints:
+            self._save_checkpoint(
+                "./kitDataMerger/merged_asv_data", self.merged, MERGED_CSV_OPTIONS
+            )
+
+        # Updating the meteorologic data
+        self.status_label.configure(text="Getting weather:")
+        self.meta = enrich_meta_data(
+            pd.read_csv(filepath_or_buffer=self.meta_path),
+            32,
+            self.progress_var,
+            self.percentage_label,
+            weather_status_label or self.status_label,
+            kit_ids={sample_file.kit_id for sample_file in self.manifest},
+            fetch_workers=self.fetch_workers,
+            provider=self.weather_provider,
+        )
+        if self.meta is None:
+            return False
+        if "meta" in self.checkpoints:
+            mark_missing_weather(self.meta).to_csv(
+                f"./kitDataMerger/meteorology/meta_data_final.csv",
+                index=False,
+                encoding="utf-16",
+            )
+
+        # Merge the meta data with the samples
+        self.public = join_meta_data(self.merged, mark_missing_weather(self.meta))
+        if "public" in self.checkpoints:
+            self._save_checkpoint(
+                "./kitDataMerger/microbiome-public", self.public, PUBLIC_CSV_OPTIONS
+            )
+
+        return True
+
+    def export(self, destination):
+        """
+        Export the public data as UTF-16, tab separated CSV files, in a process pool if there
+        is more than one worker.
+        If the public data is a checkpoint, all the kits of the samples type in its directory
+        are exported, including the kits that were not processed again.
+
+        Parameters:
+        - destination: Path of the directory to export the files to.
+
+        Returns:
+        None. A kit that could not be exported is logged and does not stop the other kits.
+        """
+        if "public" in self.checkpoints:
+            _, errors = run_tasks(
+                export_public,
+                {
+                    filename: (
+                        f"./kitDataMerger/microbiome-public/{filename}",
+                        destination,
+                    )
+                    for filename in kit_files(
+                        f"./kitDataMerger/microbiome-public", self.samples_type
+                    )
+                },
+                self.workers,
+            )
+            for filename, e in errors.items():
+                logging.error(f"Could not export {filename}: {e}")
+            return
+
+        write_frames(self.public, destination, PUBLIC_CSV_OPTIONS, workers=self.workers)
+
+    def _save_checkpoint(self, directory, frames, csv_options):
+        """
+        Save the frames of a stage to its work directory.
+
+        Parameters:
+        - directory: Path of the work directory.
+        - frames: Dictionary mapping the filename of each kit to its DataFrame.
+        - csv_options: Options of to_csv, used for CSV files.
+
+        Returns:
+        None
+        """
+        # Remove the previous outputs of the processed kits (all the kits of the samples type
+        # if kits is not provided), the outputs of the other samples type are kept
+        clear_kit_files(directory, self.samples_type, self.kits)
+
+        # Parquet files keep the abundances as floats, even for samples that sum to 0
+        if self.file_format == "parquet":
+            frames = {
+                filename: df.astype({sample: float for sample in SAMPLES})
+                for filename, df in frames.items()
+            }
+        write_frames(frames, directory, csv_options, self.file_format, self.workers)
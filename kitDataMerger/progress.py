@@ -0,0 +1,402 @@
+import sys
+
+import json
+import time
+import logging
+import threading
+
+
+class ProgressReporter:
+    """
+    Report the progress of the stages.
+
+    The stages take a progress variable and two labels, like the Tkinter widgets of the GUI.
+    A reporter provides look-alike objects for them (progress_var, percentage_label,
+    status_label and sub_status_label) which forward the updates to update_progress,
+    update_status and update_detail.
+
+    The progress is rate-limited: an update that comes too soon after the previous one is
+    held back, and only the latest held back update is reported, on the next update that
+    is allowed, on a status message or on flush. The first (0) and last (1) updates are
+    always reported.
+
+    Subclasses override status, detail, progress and error.
+    """
+
+    def __init__(self, max_hz=20):
+        """
+        Parameters:
+        - max_hz: Maximum number of progress updates per second, 0 does not limit them.
+        """
+        self.min_interval = 1 / max_hz if max_hz else 0
+        self._last_progress_time = None
+        self._pending_progress = None
+
+        self.progress_var = _ProgressVar(self)
+        self.percentage_label = _Label(self, None)
+        self.status_label = _Label(self, self.update_status)
+        self.sub_status_label = _Label(self, self.update_detail)
+
+    def update_progress(self, fraction):
+        """
+        Update the progress of the current stage, at most max_hz times per second.
+
+        Parameters:
+        - fraction: Progress between 0 and 1.
+
+        Returns:
+        None
+        """
+        now = time.monotonic()
+        if (
+            fraction <= 0
+            or fraction >= 1
+            or self._last_progress_time is None
+            or now - self._last_progress_time >= self.min_interval
+        ):
+            self._last_progress_time = now
+            self._pending_progress = None
+            self.progress(fraction)
+        else:
+            self._pending_progress = fraction
+
+    def update_status(self, text):
+        """
+        Update the status message of the current stage, after the held back progress.
+
+        Parameters:
+        - text: Status message.
+
+        Returns:
+        None
+        """
+        self.flush()
+        self.status(text)
+
+    def update_detail(self, text):
+        """
+        Update the secondary status message, after the held back progress.
+
+        Parameters:
+        - text: Status message.
+
+        Returns:
+        None
+        """
+        self.flush()
+        self.detail(text)
+
+    def flush(self):
+        """
+        Report the held back progress, if there is one.
+
+        Returns:
+        None
+        """
+        if self._pending_progress is not None:
+            fraction = self._pending_progress
+            self._pending_progress = None
+            self._last_progress_time = time.monotonic()
+            self.progress(fraction)
+
+    def status(self, text):
+        """
+        Report the status message of the current stage.
+
+        Parameters:
+        - text: Status message.
+
+        Returns:
+        None
+        """
+
+    def detail(self, text):
+        """
+        Report a secondary status message, e.g. the weather station being processed.
+
+        Parameters:
+        - text: Status message.
+
+        Returns:
+        None
+        """
+
+    def progress(self, fraction):
+        """
+        Report the progress of the current stage.
+
+        Parameters:
+        - fraction: Progress between 0 and 1.
+
+        Returns:
+        None
+        """
+
+    def error(self, title, message):
+        """
+        Report an error that the GUI would show in a message box.
+
+        Parameters:
+        - title: Title of the error.
+        - message: Error message.
+
+        Returns:
+        None
+        """
+
+
+class NullReporter(ProgressReporter):
+    """
+    Report nothing, e.g. for scripts and tests.
+    """
+
+
+class LoggingReporter(ProgressReporter):
+    """
+    Report the progress to a logger, e.g. for the log file of a headless run.
+    Status messages are logged as info, the progress and the secondary messages as debug.
+    """
+
+    def __init__(self, logger=None, max_hz=1):
+        """
+        Parameters:
+        - logger: Logger to report to, the root logger if not provided.
+        - max_hz: Maximum number of progress updates per second.
+        """
+        super().__init__(max_hz)
+        self.logger = logger if logger is not None else logging.getLogger()
+
+    def status(self, text):
+        if text:
+            self.logger.info(text)
+
+    def detail(self, text):
+        if text:
+            self.logger.debug(text)
+
+    def progress(self, fraction):
+        self.logger.debug("%.2f %%", fraction * 100)
+
+    def error(self, title, message):
+        self.logger.error(f"{title}: {message}")
+
+
+class TkProgressReporter(ProgressReporter):
+    """
+    Report the progress of a worker thread to the Tkinter widgets of the GUI.
+
+    The widgets are only updated on the Tk main loop: the updates are collected and applied
+    together by a single after() callback, so a worker thread never touches the widgets.
+    """
+
+    def __init__(
+        self,
+        widget,
+        progress_var,
+        percentage_label,
+        status_label,
+        sub_status_label=None,
+        max_hz=20,
+    ):
+        """
+        Parameters:
+        - widget: Any widget of the window, used to schedule the updates on the Tk main loop.
+        - progress_var: Tkinter variable for tracking progress.
+        - percentage_label: Tkinter label for displaying progress percentage.
+        - status_label: Tkinter label for displaying status messages.
+        - sub_status_label: Tkinter label for displaying secondary status messages,
+            they are displayed in the status label if not provided.
+        - max_hz: Maximum number of progress updates per second.
+        """
+        super().__init__(max_hz)
+        self.widget = widget
+        self.widgets = {
+            "progress": progress_var,
+            "percentage": percentage_label,
+            "status": status_label,
+            "detail": sub_status_label if sub_status_label is not None else status_label,
+        }
+        self._lock = threading.Lock()
+        self._updates = {}
+        self._scheduled = False
+
+    def status(self, text):
+        self._schedule("status", text)
+
+    def detail(self, text):
+        self._schedule("detail", text)
+
+    def progress(self, fraction):
+        self._schedule("progress", fraction)
+
+    def error(self, title, message):
+        from tkinter.messagebox import showerror
+
+        # The message box blocks the stage until it is closed, like a direct call would
+        if threading.current_thread() is threading.main_thread():
+            showerror(title, message)
+            return
+        closed = threading.Event()
+
+        def show():
+            try:
+                showerror(title, message)
+            finally:
+                closed.set()
+
+        self.widget.after(0, show)
+        closed.wait()
+
+    def _schedule(self, kind, value):
+        # Keep only the latest value of each kind, and schedule a single callback for all of them
+        with self._lock:
+            self._updates[kind] = value
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self.widget.after(0, self._apply)
+
+    def _apply(self):
+        with self._lock:
+            updates = self._updates
+            self._updates = {}
+            self._scheduled = False
+
+        if "progress" in updates:
+            self.widgets["progress"].set(updates["progress"])
+            self.widgets["percentage"].configure(
+                text=(("%.2f " % (updates["progress"] * 100)) + "%")
+            )
+        if "status" in updates:
+            self.widgets["status"].configure(text=updates["status"])
+        if "detail" in updates:
+            self.widgets["detail"].configure(text=updates["detail"])
+
+
+class TextReporter(ProgressReporter):
+    """
+    Report the progress as plain text lines, e.g. for a terminal.
+    Progress is reported in steps of 10%.
+    """
+
+    def __init__(self, stream=None, max_hz=20):
+        """
+        Parameters:
+        - stream: Text stream to write to, sys.stderr if not provided.
+        - max_hz: Maximum number of progress updates per second.
+        """
+        super().__init__(max_hz)
+        self.stream = stream if stream is not None else sys.stderr
+        self._last_step = None
+
+    def status(self, text):
+        if text:
+            self._write(text)
+        self._last_step = None
+
+    def detail(self, text):
+        if text:
+            self._write(f"  {text}")
+
+    def progress(self, fraction):
+        step = int(fraction * 10)
+        if step != self._last_step:
+            self._last_step = step
+            self._write(f"  {step * 10}%")
+
+    def error(self, title, message):
+        self._write(f"ERROR: {title}: {message}")
+
+    def _write(self, line):
+        self.stream.write(f"{line}\n")
+        self.stream.flush()
+
+
+class JsonLinesReporter(ProgressReporter):
+    """
+    Report the progress as JSON lines, one event per line, for other programs to read.
+
+    Every event has an "event" ("status", "detail", "progress" or "error") and a "time"
+    (seconds since the epoch), e.g. {"event": "progress", "time": 1700000000.0, "fraction": 0.5}
+    """
+
+    def __init__(self, stream=None, max_hz=20):
+        """
+        Parameters:
+        - stream: Text stream to write to, sys.stdout if not provided.
+        - max_hz: Maximum number of progress updates per second.
+        """
+        super().__init__(max_hz)
+        self.stream = stream if stream is not None else sys.stdout
+
+    def status(self, text):
+        self._write("status", text=text)
+
+    def detail(self, text):
+        self._write("detail", text=text)
+
+    def progress(self, fraction):
+        self._write("progress", fraction=round(fraction, 6))
+
+    def error(self, title, message):
+        self._write("error", title=title, message=message)
+
+    def _write(self, event, **fields):
+        self.stream.write(
+            json.dumps({"event": event, "time": time.time(), **fields}, ensure_ascii=False)
+            + "\n"
+        )
+        self.stream.flush()
+
+
+def report_error(label, title, message):
+    """
+    Show an error in a message box, or report it to the reporter of the label when there is no display.
+
+    Parameters:
+    - label: A label of the stage, a Tkinter label or one of the labels of a ProgressReporter.
+    - title: Title of the error.
+    - message: Error message.
+
+    Returns:
+    None
+    """
+    reporter = getattr(label, "reporter", None)
+    if isinstance(reporter, ProgressReporter):
+        reporter.error(title, message)
+        return
+
+    from tkinter.messagebox import showerror
+
+    showerror(title, message)
+
+
+class _ProgressVar:
+    """
+    Look-alike of the Tkinter progress variable, forwarding the progress to a reporter.
+    """
+
+    def __init__(self, reporter):
+        self.reporter = reporter
+        self._value = 0
+
+    def set(self, value):
+        self._value = value
+        self.reporter.update_progress(value)
+
+    def get(self):
+        return self._value
+
+
+class _Label:
+    """
+    Look-alike of a Tkinter label, forwarding its text to a reporter.
+    """
+
+    def __init__(self, reporter, callback):
+        self.reporter = reporter
+        self._callback = callback
+
+    def configure(self, text=None, **kwargs):
+        if text is not None and self._callback is not None:
+            self._callback(text)
@@ -0,0 +1,92 @@
+import re
+from enum import Enum
+
+# Sample files are named S{kit id}_{sample category}{anything}, e.g. S12_F.csv or S12_Fr_2023.csv
+_SAMPLE_PATTERN = re.compile(r"^S(\d+)_(Fr|R|S|F|L)(.*)")
+
+# Merged files are named S_{kit id}_{samples type}, e.g. S_12_Fungi.csv
+_MERGED_PATTERN = re.compile(r"^S_(\d+)_")
+
+
+class Sample(str, Enum):
+    """
+    The sample categories of a kit.
+    """
+
+    F = "F"
+    R = "R"
+    S = "S"
+    Fr = "Fr"
+    L = "L"
+
+
+# Look the categories up by their code, which is cheaper than calling Sample(code)
+_SAMPLES_BY_CODE = {sample.value: sample for sample in Sample}
+
+
+class SampleName:
+    """
+    A parsed sample filename.
+
+    Attributes:
+    - kit_id: Kit id as an integer.
+    - sample: Sample category.
+    - suffix: The rest of the filename after the sample category.
+    """
+
+    __slots__ = ("kit_id", "sample", "suffix")
+
+    def __init__(self, kit_id: int, sample: Sample, suffix: str):
+        self.kit_id = kit_id
+        self.sample = sample
+        self.suffix = suffix
+
+    def __repr__(self):
+        return f"SampleName(kit_id={self.kit_id}, sample={self.sample.value}, suffix={self.suffix!r})"
+
+
+def parse_sample_name(filename):
+    """
+    Parse a sample filename.
+
+    Parameters:
+    - filename: Name of the file.
+
+    Returns:
+    SampleName of the file, or None if the file is not a sample file.
+    """
+    match = _SAMPLE_PATTERN.match(filename)
+    if not match:
+        return None
+    kit_id, code, suffix = match.groups()
+    return SampleName(int(kit_id), _SAMPLES_BY_CODE[code], suffix)
+
+
+def normalize_sample_name(filename):
+    """
+    Normalize a sample filename the way it is saved in the filtered data.
+    The filename is upper-cased, unless it is an "Fr" sample which must keep its case.
+
+    Parameters:
+    - filename: Name of the file.
+
+    Returns:
+    The normalized filename.
+    """
+    return filename.upper() if not "Fr" in filename else filename
+
+
+def parse_merged_name(filename):
+    """
+    Parse the kit id of a merged filename (S_{kit id}_{samples type}).
+
+    Parameters:
+    - filename: Name of the merged file.
+
+    Returns:
+    Kit id as an integer, or None if the file is not a merged file.
+    """
+    match = _MERGED_PATTERN.match(filename)
+    if not match:
+        return None
+    return int(match.group(1))
@@ -0,0 +1,267 @@
+import os
+
+import io
+import shutil
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from .sample_name import parse_merged_name
+
+# Parquet files need pyarrow, which is optional
+try:
+    import pyarrow  # noqa: F401
+
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+# The file formats of the merged data (merged_asv_data) and the public data (microbiome-public)
+FORMATS = ["csv", "parquet"]
+
+# The CSV options of each kind of file
+MERGED_CSV_OPTIONS = {}
+PUBLIC_CSV_OPTIONS = {"encoding": "utf-16", "sep": "\t"}
+
+
+def kit_filename(kit, samples_type, file_format="csv"):
+    """
+    Get the filename of a kit's merged or public data.
+
+    Parameters:
+    - kit: Kit id.
+    - samples_type: "Fungi" or "Bacteria".
+    - file_format: "csv" or "parquet".
+
+    Returns:
+    The filename, e.g. S_12_Fungi.csv
+    """
+    return f"S_{kit}_{samples_type}.{file_format}"
+
+
+def kit_files(directory, samples_type, kits=None):
+    """
+    List the merged or public files of a samples type in a directory, in any file format.
+    The merged and public directories hold the files of both samples types.
+
+    Parameters:
+    - directory: Path of the directory.
+    - samples_type: "Fungi" or "Bacteria".
+    - kits: Ids of the kits to list, the files of all the kits are listed if not provided.
+
+    Returns:
+    List of the filenames, empty if the directory does not exist.
+    """
+    if not os.path.exists(directory):
+        return []
+    files = []
+    for filename in os.listdir(directory):
+        kit = parse_merged_name(filename)
+        if kit is None or (kits is not None and kit not in kits):
+            continue
+        if filename in {
+            kit_filename(kit, samples_type, file_format) for file_format in FORMATS
+        }:
+            files.append(filename)
+    return files
+
+
+def clear_kit_files(directory, samples_type, kits=None):
+    """
+    Remove the merged or public files of a samples type from a directory, and create the
+    directory if it does not exist. The files of the other samples type are kept.
+
+    Parameters:
+    - directory: Path of the directory.
+    - samples_type: "Fungi" or "Bacteria".
+    - kits: Ids of the kits whose files are removed, the files of all the kits are removed
+        if not provided.
+
+    Returns:
+    None
+    """
+    for filename in kit_files(directory, samples_type, kits):
+        os.remove(os.path.join(directory, filename))
+    os.makedirs(directory, exist_ok=True)
+
+
+def run_tasks(function, tasks, workers=1):
+    """
+    Call a function for each task, in a process pool if there is more than one worker.
+    A task that fails does not stop the other tasks.
+
+    Parameters:
+    - function: Function to call, it must be picklable (a module level function).
+    - tasks: Dictionary mapping the key of each task to the tuple of its arguments.
+    - workers: Number of worker processes, 1 calls the function in the current process.
+
+    Returns:
+    Tuple of a dictionary mapping the key of each task that succeeded to its result, in the
+    order of the tasks, and a dictionary mapping the key of each task that failed to its error.
+    """
+    results = {}
+    errors = {}
+    if workers <= 1:
+        for key, arguments in tasks.items():
+            try:
+                results[key] = function(*arguments)
+            except Exception as e:
+                errors[key] = e
+        return results, errors
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(function, *arguments): key
+            for key, arguments in tasks.items()
+        }
+        for future in as_completed(futures):
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                errors[futures[future]] = e
+    return {key: results[key] for key in tasks if key in results}, errors
+
+
+def check_format(file_format):
+    """
+    Make sure a file format is known and can be used.
+
+    Parameters:
+    - file_format: "csv" or "parquet".
+
+    Returns:
+    None. Raises ValueError for an unknown format and ImportError if pyarrow is missing for parquet.
+    """
+    if file_format not in FORMATS:
+        raise ValueError(f"Unknown file format: {file_format}")
+    if file_format == "parquet" and not PARQUET_AVAILABLE:
+        raise ImportError("The parquet format requires pyarrow to be installed.")
+
+
+def write_frame(df: pd.DataFrame, path, csv_options):
+    """
+    Save a DataFrame by the extension of its path.
+    Parquet files keep typed columns: text columns are saved as strings and numbers as numbers.
+
+    Parameters:
+    - df: Pandas DataFrame to save.
+    - path: Path of the file (.csv or .parquet).
+    - csv_options: Options of to_csv, used for CSV files.
+
+    Returns:
+    None
+    """
+    if path.endswith(".parquet"):
+        typed = df.copy()
+        for column in typed.columns:
+            if typed[column].dtype == object:
+                typed[column] = typed[column].astype("string")
+        typed.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False, **csv_options)
+
+
+def write_frames(frames, directory, csv_options, file_format="csv", workers=1):
+    """
+    Save the DataFrame of each kit as a file of a directory, in a process pool if there is
+    more than one worker.
+
+    Parameters:
+    - frames: Dictionary mapping the filename of each kit to its DataFrame, the extension of
+        the filename is replaced with the file format.
+    - directory: Path of the directory.
+    - csv_options: Options of to_csv, used for CSV files.
+    - file_format: "csv" or "parquet".
+    - workers: Number of worker processes, 1 writes the files in the current process.
+
+    Returns:
+    Number of saved files. A file that could not be saved is logged and does not stop the
+    other files from being saved.
+    """
+    saved, errors = run_tasks(
+        write_frame,
+        {
+            filename: (
+                df,
+                os.path.join(
+                    directory, f"{os.path.splitext(filename)[0]}.{file_format}"
+                ),
+                csv_options,
+            )
+            for filename, df in frames.items()
+        },
+        workers,
+    )
+    for filename, e in errors.items():
+        logging.error(f"Could not save {filename} to {directory}: {e}")
+    return len(saved)
+
+
+def read_frame(path, csv_options, usecols=None):
+    """
+    Load a DataFrame by the extension of its path.
+
+    Parameters:
+    - path: Path of the file (.csv or .parquet).
+    - csv_options: Options of read_csv, used for CSV files.
+    - usecols: Columns to load, all the columns are loaded if not provided.
+
+    Returns:
+    Pandas DataFrame.
+    """
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path, columns=usecols)
+    return pd.read_csv(path, usecols=usecols, **csv_options)
+
+
+def as_read_back(df, csv_options, integral_columns=()):
+    """
+    Get a DataFrame the way it is read back from a CSV file, with the column types (and float
+    values) read_csv gives them. The data uploaded from memory gets the same types as the data
+    that was uploaded from the saved files.
+
+    Parameters:
+    - df: Pandas DataFrame.
+    - csv_options: Options of to_csv and read_csv of the file.
+    - integral_columns: Float columns that are read back as integers when all their values are
+        whole numbers, e.g. the weather columns, whose whole values were saved as integers.
+
+    Returns:
+    Pandas DataFrame read back from the CSV text of the DataFrame.
+    """
+    # The encoding only changes the bytes of the file, not the values that are read back
+    options = {key: value for key, value in csv_options.items() if key != "encoding"}
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, **options)
+    buffer.seek(0)
+    df = pd.read_csv(buffer, **options)
+
+    for column in integral_columns:
+        if column in df.columns and df[column].dtype == float:
+            values = df[column]
+            if values.notna().all() and (values % 1 == 0).all():
+                df[column] = values.astype("int64")
+    return df
+
+
+def export_public(source, destination):
+    """
+    Export a public data file as a UTF-16, tab separated CSV file.
+
+    Parameters:
+    - source: Path of the public data file (.csv or .parquet).
+    - destination: Path of the directory to export the file to.
+
+    Returns:
+    None
+    """
+    filename = os.path.basename(source)
+    if filename.endswith(".parquet"):
+        read_frame(source, PUBLIC_CSV_OPTIONS).to_csv(
+            os.path.join(destination, f"{filename[: -len('.parquet')]}.csv"),
+            index=False,
+            **PUBLIC_CSV_OPTIONS,
+        )
+    else:
+        shutil.copy2(source, os.path.join(destination, filename))
@@ -1,5 +1,6 @@
 import os
 import sys
+import multiprocessing
 
 import customtkinter as ctk
 
@@ -176,5 +177,7 @@ def menu():
 
 
 if __name__ == "__main__":
+    # Needed by the worker processes of the frozen executable
+    multiprocessing.freeze_support()
     loading_screen()
     menu()
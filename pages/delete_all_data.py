@@ -6,6 +6,7 @@ import threading
 import logging
 
 from utils import get_google_creds
+from kitDataMerger.progress import TkProgressReporter
 from google.cloud import firestore
 from google.cloud.firestore import FieldFilter
 from google.oauth2 import service_account
@@ -37,13 +38,18 @@ def delete_data(notebook):
     ):
         return
 
+    # Report the progress of this worker thread on the Tk main loop, at most 20 times a second
+    reporter = TkProgressReporter(
+        status_label, progress_var, percentage_label, status_label
+    )
+
     # Disable buttons to prevent user interaction during deletion process
     notebook.configure(state="disabled")
     submit_button.configure(state="disabled")
     type_dropdown.configure(state="disabled")
 
     # Update status label
-    status_label.configure(text="deleting...")
+    reporter.update_status("deleting...")
 
     if selected_type.get() == "All":
         # If the user selected "All" in the deletion type, the function will query all the data
@@ -72,15 +78,14 @@ def delete_data(notebook):
             count += 1
             deleted += 1
             progress = count / total_records
-            progress_var.set(progress)
-            percentage_label.configure(text=(("%.2f " % (progress * 100)) + "%"))
+            reporter.update_progress(progress)
 
         if deleted == 0:
             break
         batch.commit()
 
     # Update status label and display success message
-    status_label.configure(text="The data has been deleted successfully.")
+    reporter.update_status("The data has been deleted successfully.")
     showinfo("The data has been deleted", "The data has been deleted successfully.")
 
     # Log deletion operation as a success
@@ -9,6 +9,7 @@ from google.oauth2 import service_account
 from google.cloud.firestore import FieldFilter
 
 from utils import get_google_creds
+from kitDataMerger.progress import TkProgressReporter
 
 # Get the credentials from .env file
 creds = get_google_creds()
@@ -55,6 +56,11 @@ def delete_samples(notebook):
     ):
         return
 
+    # Report the progress of this worker thread on the Tk main loop, at most 20 times a second
+    reporter = TkProgressReporter(
+        status_label, progress_var, percentage_label, status_label
+    )
+
     # Disable all the buttons to prevent user interaction
     notebook.configure(state="disabled")
     kit_number_entry.configure(state="disabled")
@@ -62,7 +68,7 @@ def delete_samples(notebook):
     type_dropdown.configure(state="disabled")
 
     # Step 6: Update status label
-    status_label.configure(text="Deleting...")
+    reporter.update_status("Deleting...")
 
     if selected_type.get() != "All":
         # if the user don't want to delete all the data but a specific Kingdom, the fuction will create a query with a filter
@@ -101,11 +107,10 @@ def delete_samples(notebook):
         record.reference.delete()
         count += 1
         progress = count / total_records
-        progress_var.set(progress)
-        percentage_label.configure(text=(("%.2f " % (progress * 100)) + "%"))
+        reporter.update_progress(progress)
 
     # Update status label and display success message
-    status_label.configure(text="The Kit has been deleted")
+    reporter.update_status("The Kit has been deleted")
     showinfo("The kit has been deleted", "The kit has been deleted successfully.")
 
     # Log deletion operation as a success
@@ -13,6 +13,7 @@ import csv
 import logging
 
 from utils import get_google_creds
+from kitDataMerger.progress import TkProgressReporter
 from google.cloud import firestore
 from google.oauth2 import service_account
 
@@ -65,13 +66,18 @@ def get_data(notebook):
     if not selected_dir:
         return
 
+    # Report the progress of this worker thread on the Tk main loop, at most 20 times a second
+    reporter = TkProgressReporter(
+        status_label, progress_var, percentage_label, status_label
+    )
+
     # Disable all the buttons to avoid user interaction.
     notebook.configure(state="disabled")
     location_entry.configure(state="disabled")
     select_dir_button.configure(state="disabled")
     submit_button.configure(state="disabled")
 
-    status_label.configure(text="Initalizing connection...")
+    reporter.update_status("Initalizing connection...")
 
     # Get records from the database
     records_to_get = db.collection("microbiome").stream()
@@ -86,14 +92,14 @@ def get_data(notebook):
     if total_records == 0:
         showerror("No records found", "There are no records found.")
         notebook.configure(state="normal")
-        status_label.configure(text="")
+        reporter.update_status("")
         logging.info("No records found in Google.")
         location_entry.configure(state="normal")
         select_dir_button.configure(state="normal")
         submit_button.configure(state="normal")
         return
 
-    status_label.configure(text="Getting data...")
+    reporter.update_status("Getting data...")
 
     # Create a list of all the records as dictionaries
     records = []
@@ -101,14 +107,13 @@ def get_data(notebook):
         records.append(record.to_dict())
         progress_counter += 1
         progress = progress_counter / total_records
-        progress_var.set(progress)
-        percentage_label.configure(text=(("%.2f" % (progress * 100)) + "%"))
+        reporter.update_progress(progress)
 
     # Write the retrieved data to a CSV file in the selected directory
     write_dicts_to_csv(selected_dir, records)
 
     # Update status label to indicate successful data retrieval and file saving
-    status_label.configure(text="The file was saved successfully.")
+    reporter.update_status("The file was saved successfully.")
 
     # Display information message indicating successful file save
     showinfo(
@@ -11,6 +11,7 @@ import logging
 import csv
 
 from utils import get_google_creds
+from kitDataMerger.progress import TkProgressReporter
 from google.cloud import firestore
 from google.cloud.firestore import FieldFilter
 from google.oauth2 import service_account
@@ -79,6 +80,11 @@ def get_kit(notebook):
     if not selected_kit:
         return
 
+    # Report the progress of this worker thread on the Tk main loop, at most 20 times a second
+    reporter = TkProgressReporter(
+        status_label, progress_var, percentage_label, status_label
+    )
+
     # Disable the buttons to avoid user interaction during the data downloading process
     notebook.configure(state="disabled")
     kit_number_entry.configure(state="disabled")
@@ -86,7 +92,7 @@ def get_kit(notebook):
     submit_button.configure(state="disabled")
     location_entry.configure(state="disabled")
 
-    status_label.configure(text="Initializing connection...")
+    reporter.update_status("Initializing connection...")
 
     # Get the data as a Generator
     records_to_get = (
@@ -104,7 +110,7 @@ def get_kit(notebook):
     # If there is no records, then show an error and enable back the buttons
     if len(records_to_get) == 0:
         showerror("No records found", "There are no records found.")
-        status_label.configure(text="No records found in Google")
+        reporter.update_status("No records found in Google")
         location_entry.configure(state="normal")
         select_dir_button.configure(state="normal")
         submit_button.configure(state="normal")
@@ -113,19 +119,18 @@ def get_kit(notebook):
         return
 
     # Create a list of records as dictionaries
-    status_label.configure(text="Getting Data...")
+    reporter.update_status("Getting Data...")
     records = []
     for record in records_to_get:
         records.append(record.to_dict())
         progress_counter += 1
         progress = progress_counter / total_records
-        progress_var.set(progress)
-        percentage_label.configure(text=(("%.2f" % (progress * 100)) + "%"))
+        reporter.update_progress(progress)
 
     # Call the function that saving the data as a csv file
     write_dicts_to_csv(selected_dir, records, selected_kit)
 
-    status_label.configure(text="The data has been saved!")
+    reporter.update_status("The data has been saved!")
 
     # Display success massage
     showinfo(
@@ -12,10 +12,10 @@ from datetime import datetime
 
 from GCP.connect_GCP import fetch_and_index_data
 
-from kitDataMerger.data_filter import filter
-from kitDataMerger.file_merger import merge_data
-from kitDataMerger.meta_data_merger import merge_meta_data
-from kitDataMerger.meteorology.get_weather import update_weather
+from kitDataMerger.manifest import scan_samples
+from kitDataMerger.incremental import plan_incremental, save_state
+from kitDataMerger.pipeline import Pipeline
+from kitDataMerger.progress import TkProgressReporter
 from kitDataMerger.fungi.update_fungi_ids import update_fungi_ids
 
 log_file_path = (
@@ -48,6 +48,8 @@ selected_type = None
 samples_type_optionbox = None
 meta_entry_variable = None
 dir_entry_variable = None
+incremental_var = None
+incremental_check = None
 
 
 def upload_samples(notebook):
@@ -55,70 +57,90 @@ def upload_samples(notebook):
     selected_dir = dir_entry_variable.get()
     selected_meta = meta_entry_variable.get()
     upload_type = selected_type.get()
+    incremental = incremental_var.get() == 1
 
     # Making sure that the data dir path and meta data file path are not empty
     if not selected_dir or not selected_meta:
         return
 
+    # Report the progress of this worker thread on the Tk main loop, at most 20 times a second
+    reporter = TkProgressReporter(
+        status_label, progress_var, percentage_label, status_label, status_sub_label
+    )
+
     # Disable all the buttons to avoid user interaction during the upload.
-    notebook.configure(state="disabled")
-    submit_button.configure(state="disabled")
-    select_dir_button.configure(state="disabled")
-    select_meta_button.configure(state="disabled")
-    dir_entry.configure(state="disabled")
-    meta_entry.configure(state="disabled")
-    generate_check.configure(state="disabled")
-    samples_type_optionbox.configure(state="disabled")
+    set_inputs_state(notebook, "disabled")
 
     # Initializing the progress bar
-    percentage_label.configure(text="0%")
-    status_label.configure(text="Working...")
+    reporter.progress_var.set(0)
+    reporter.status_label.configure(text="Working...")
 
     # If the upload type is Fungi, the program will also search for ids of the Fungis
     if upload_type == "Fungi":
-        status_label.configure(text="Geting Fungi Ids")
-        update_fungi_ids(selected_dir, progress_var, percentage_label)
-
-    if filter(
-        (
-            selected_dir
-            if upload_type != "Fungi"
-            else "./kitDataMerger/fungi/data/microbiome-public"
-        ),
-        progress_var,
-        percentage_label,
-        status_label,
-        upload_type,
-    ):
-
-        # Merge samples
-        num_files = merge_data(
-            progress_var, percentage_label, status_label, upload_type
-        )
+        reporter.status_label.configure(text="Geting Fungi Ids")
+        try:
+            update_fungi_ids(
+                selected_dir,
+                reporter.progress_var,
+                reporter.percentage_label,
+                workers=os.cpu_count() or 1,
+            )
+        except FileNotFoundError:
+            # The error was already shown, let the user fix the files and try again
+            reporter.status_label.configure(text="")
+            set_inputs_state(notebook, "normal")
+            return
 
-        # Updating the meteorologic data
-        status_label.configure(text="Getting weather:")
-        if not update_weather(
-            selected_meta, 32, progress_var, percentage_label, status_sub_label
+    # Scan the data directory once, every stage uses the manifest of its sample files
+    data_dir = (
+        selected_dir
+        if upload_type != "Fungi"
+        else "./kitDataMerger/fungi/data/microbiome-public"
+    )
+    manifest = scan_samples(data_dir, upload_type)
+
+    # Only the kits whose files or metadata changed since the last run are processed again
+    kits = None
+    if incremental:
+        kits, incremental_state = plan_incremental(manifest, selected_meta, upload_type)
+
+    # Filter, merge and add the meta data in memory, an incremental run also saves
+    # its merged and public data for the next run
+    pipeline = Pipeline(
+        data_dir,
+        selected_meta,
+        upload_type,
+        reporter.progress_var,
+        reporter.percentage_label,
+        reporter.status_label,
+        workers=os.cpu_count() or 1,
+        checkpoints=("merged", "public") if incremental else (),
+        kits=kits,
+    )
+    if manifest or kits is not None:
+        if not pipeline.run(
+            manifest=manifest, weather_status_label=reporter.sub_status_label
         ):
-            shutil.rmtree("./kitDataMerger/merged_asv_data")
             return
 
-        # Merge the meta data with the samples
-        merge_meta_data()
-
         # Uploading of the data if the user chose to upload it.
         if check_var.get() == 1:
             fetch_and_index_data(
-                progress_var,
-                percentage_label,
-                status_label,
-                num_files,
+                reporter.progress_var,
+                reporter.percentage_label,
+                reporter.status_label,
+                len(pipeline.public),
                 index_name="microbiome",
+                kits=kits,
+                frames=pipeline.public,
             )
 
-        status_label.configure(text="Saving data...")
-        status_sub_label.configure(text="")
+        # Remember the processed files, so the next incremental run can skip them
+        if incremental:
+            save_state(upload_type, incremental_state)
+
+        reporter.status_label.configure(text="Saving data...")
+        reporter.sub_status_label.configure(text="")
 
         bad_dir = True
         # Ask for a new destination if merged data already exists in the selected one
@@ -127,15 +149,7 @@ def upload_samples(notebook):
                 # Ask for a directory and copy all the public data to the destination
                 path = filedialog.askdirectory()
                 os.makedirs(f"{path}/microbiome-output/microbiome-public-data")
-                for filename in os.listdir(f"kitDataMerger/microbiome-public"):
-                    with open(
-                        f"{path}/microbiome-output/microbiome-public-data/{filename}",
-                        "w",
-                    ) as f:
-                        shutil.copy2(
-                            f"kitDataMerger/microbiome-public/{filename}",
-                            f"{path}/microbiome-output/microbiome-public-data/{filename}",
-                        )
+                pipeline.export(f"{path}/microbiome-output/microbiome-public-data")
 
                 # If the upload type is a fungi, the function will also copy the private data (lab data)
                 if upload_type == "Fungi":
@@ -154,12 +168,10 @@ def upload_samples(notebook):
                                     f"kitDataMerger/fungi/data/microbiome-private/{seq_folder}/{filename}",
                                     f"{path}/microbiome-output/microbiome-private-data/{filename}",
                                 )
-                # Remove the work directories
-                shutil.rmtree(f"./kitDataMerger/merged_asv_data")
-                shutil.rmtree(f"./kitDataMerger/microbiome-public")
+                # Remove the fungi work directory (the other stages were kept in memory,
+                # and an incremental run keeps its checkpoints for the next run)
                 if upload_type == "Fungi":
                     shutil.rmtree(f"./kitDataMerger/fungi/data")
-                os.remove(f"./kitdataMerger/meteorology/meta_data_final.csv")
 
                 # Alert the users when the files have been saved successfully
                 showinfo(
@@ -180,8 +192,8 @@ def upload_samples(notebook):
                 continue
 
         # Update the status message when all the files have been merged
-        status_label.configure(text="All files has been generated!")
-        status_sub_label.configure(text="")
+        reporter.status_label.configure(text="All files has been generated!")
+        reporter.sub_status_label.configure(text="")
 
     else:
         # Alert if there was any problem with filtering the data
@@ -200,14 +212,20 @@ def upload_samples(notebook):
             )
 
     # Enabeling back all the buttons
-    submit_button.configure(state="normal")
-    select_dir_button.configure(state="normal")
-    select_meta_button.configure(state="normal")
-    dir_entry.configure(state="normal")
-    meta_entry.configure(state="normal")
-    generate_check.configure(state="normal")
-    samples_type_optionbox.configure(state="normal")
-    notebook.configure(state="normal")
+    set_inputs_state(notebook, "normal")
+
+
+def set_inputs_state(notebook, state):
+    # Enable ("normal") or disable ("disabled") all the buttons and fields of the page
+    notebook.configure(state=state)
+    submit_button.configure(state=state)
+    select_dir_button.configure(state=state)
+    select_meta_button.configure(state=state)
+    dir_entry.configure(state=state)
+    meta_entry.configure(state=state)
+    generate_check.configure(state=state)
+    incremental_check.configure(state=state)
+    samples_type_optionbox.configure(state=state)
 
 
 def start_processing(notebook):
@@ -231,7 +249,7 @@ def select_file():
 
 
 def upload_samples_gui(root, notebook):
-    global dir_entry, meta_label, meta_entry, select_meta_button, select_dir_button, submit_button, progress_var, progress_bar, percentage_label, status_label, check_var, status_sub_label, generate_check, selected_type, samples_type_optionbox, dir_entry_variable, meta_entry_variable, samples_type_optionbox
+    global dir_entry, meta_label, meta_entry, select_meta_button, select_dir_button, submit_button, progress_var, progress_bar, percentage_label, status_label, check_var, status_sub_label, generate_check, selected_type, samples_type_optionbox, dir_entry_variable, meta_entry_variable, samples_type_optionbox, incremental_var, incremental_check
 
     # Create a title for the application
     title_label = ctk.CTkLabel(
@@ -356,3 +374,15 @@ def upload_samples_gui(root, notebook):
         font=("Helvetica", 14),
     )
     generate_check.pack()
+
+    # Create a checkbox to process only the kits that changed since the last run
+    incremental_var = ctk.IntVar(value=0)
+    incremental_check = ctk.CTkCheckBox(
+        root,
+        text="Only Process Changed Kits",
+        variable=incremental_var,
+        onvalue=1,
+        offvalue=0,
+        font=("Helvetica", 14),
+    )
+    incremental_check.pack(pady=10)
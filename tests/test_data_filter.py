@@ -0,0 +1,60 @@
+import pandas as pd
+import pytest
+
+from kitDataMerger.data_filter import filter
+from kitDataMerger.file_merger import merge_frames
+
+
+class Label:
+    """
+    Look-alike of the Tkinter variable and labels of the progress.
+    """
+
+    def set(self, value):
+        pass
+
+    def configure(self, **kwargs):
+        pass
+
+
+@pytest.fixture
+def fungi_dir(tmp_path, monkeypatch):
+    """
+    Two seq folders with the same sample of kit 1, from two sequencing runs with different
+    taxa, and another sample of kit 1 in the first folder.
+    """
+    monkeypatch.chdir(tmp_path)
+    runs = {
+        "seq1": {"S1_F.csv": ["Alpha", "Beta"], "S1_R.csv": ["Alpha"]},
+        "seq2": {"S1_F.csv": ["Gamma"]},
+    }
+    for seq, files in runs.items():
+        (tmp_path / "data" / seq).mkdir(parents=True)
+        for filename, taxa in files.items():
+            pd.DataFrame(
+                {
+                    "id": [f"SH{position}" for position in range(len(taxa))],
+                    "taxon": [
+                        f"k__Fungi;p__P;c__C;o__O;f__F;g__{genus};s__S"
+                        for genus in taxa
+                    ],
+                    "freq": [1.0] * len(taxa),
+                }
+            ).to_csv(tmp_path / "data" / seq / filename)
+    return tmp_path / "data"
+
+
+@pytest.mark.parametrize("staging", ["copy", "link", "manifest"])
+def test_sample_of_two_seq_folders_is_taken_once(fungi_dir, staging):
+    label = Label()
+
+    manifest = filter(str(fungi_dir), label, label, label, "Fungi", staging=staging)
+    merged = merge_frames(label, label, label, "Fungi", manifest=manifest)
+
+    assert sorted(sample_file.name for sample_file in manifest) == [
+        "S1_F.csv",
+        "S1_R.csv",
+    ]
+    # The F sample has the taxa of one of the runs only
+    kit = merged["S_1_Fungi.csv"]
+    assert sorted(kit.loc[kit["F"] > 0, "Genus"]) in (["Alpha", "Beta"], ["Gamma"])
@@ -0,0 +1,193 @@
+import pandas as pd
+import pytest
+
+from kitDataMerger.fungi.get_fungi_id import files_to_id
+from kitDataMerger.fungi.reference import load_reference
+
+# Groups of the taxonomy reference: a group of several SHs, a group of one SH, and a group of
+# an uncertain placement (Incertae sedis). "g__Gamma" is not in the reference.
+REFERENCE = (
+    "SH1.09FU, SH2.09FU\tk__Fungi;g__Alpha\n"
+    "SH3.09FU\tk__Fungi;g__Beta\n"
+    "SH4.09FU\tk__Fungi;g__Incertae_sedis\n"
+)
+
+TAXONOMY = pd.DataFrame(
+    {
+        "Feature ID": ["f1", "f2", "f3", "f4", "f5", "f6"],
+        "Taxon": [
+            "k__Fungi;g__Alpha",
+            "k__Fungi;g__Alpha",
+            "k__Fungi;g__Beta",
+            "k__Fungi;g__Incertae_sedis",
+            "k__Fungi;g__Gamma",
+            "k__Fungi;g__Delta",
+        ],
+        "Consensus": [0.99, 0.95, 0.9, 0.8, 0.7, 0.6],
+    }
+)
+
+REP = pd.DataFrame(
+    {
+        "feature_id": ["f1", "f2", "f3", "f4", "f5", "f6", "f7"],
+        "sequence": ["AAC", "AAG", "ACC", "AGG", "CCA", "CGA", "GGA"],
+    }
+)
+
+# The taxon names of the ASV file end with characters that are not letters
+ASV = pd.DataFrame(
+    {
+        "id": [
+            "k__Fungi;g__Alpha__1",
+            "k__Fungi;g__Beta2",
+            "k__Fungi;g__Gamma_3",
+            "k__Fungi;g__Incertae_sedis 4",
+        ],
+        "prob": [30, 10, 20, 40],
+        "other": [1, 2, 3, 4],
+    }
+)
+
+
+# The public output of the files above
+PUBLIC = pd.DataFrame(
+    {
+        "id": ["SH1.09FU", "SH3.09FU", "f5", "f4"],
+        "feature_id": ["['f1', 'f2']", "['f3']", "['f5']", "['f4']"],
+        "taxon": [
+            "k__Fungi;g__Alpha",
+            "k__Fungi;g__Beta",
+            "k__Fungi;g__Gamma",
+            "k__Fungi;g__Incertae_sedis",
+        ],
+        "consensus": [0.99, 0.9, 0.7, 0.8],
+        "freq": [0.3, 0.1, 0.2, 0.4],
+        "number_of_reads": [30.0, 10.0, 20.0, 40.0],
+        "group": ["SH1.09FU, SH2.09FU", "SH3.09FU", "", ""],
+        # The length of the group's text, as the ids were always counted
+        "number_of_sh": [18, 8, 0, 0],
+    }
+)
+
+# The private output of the files above, f7 has no taxonomy
+PRIVATE = pd.DataFrame(
+    {
+        "feature_id": ["f1", "f2", "f3", "f4", "f5", "f6"],
+        "taxon": TAXONOMY["Taxon"],
+        "consensus": TAXONOMY["Consensus"],
+        "sequence": ["AAC", "AAG", "ACC", "AGG", "CCA", "CGA"],
+    }
+)
+
+
+def run_files_to_id(tmp_path, asv=ASV, taxonomy=TAXONOMY, rep=REP):
+    """
+    Run files_to_id on an ASV file, and return the paths of its public and private outputs.
+    """
+    (tmp_path / "reference.txt").write_text(REFERENCE)
+    asv.to_csv(tmp_path / "S1_F.csv", index=False)
+    taxonomy.to_csv(tmp_path / "S1_F_rep_taxonomy.fasta.csv", index=False)
+    rep.to_csv(tmp_path / "S1_F_rep.fasta.csv", index=False)
+    for directory in ("microbiome-public", "microbiome-private"):
+        (tmp_path / "out" / directory / "seq1").mkdir(parents=True)
+
+    files_to_id(
+        str(tmp_path / "S1_F.csv"),
+        str(tmp_path / "S1_F_rep_taxonomy.fasta.csv"),
+        str(tmp_path / "S1_F_rep.fasta.csv"),
+        "seq1",
+        str(tmp_path / "out"),
+        reference=load_reference(str(tmp_path / "reference.txt"), cache_path=None),
+    )
+    return (
+        tmp_path / "out" / "microbiome-public" / "seq1" / "S1_F.csv",
+        tmp_path / "out" / "microbiome-private" / "seq1" / "S1_F.csv",
+    )
+
+
+def read_public(path):
+    return pd.read_csv(path, index_col=0, keep_default_na=False)
+
+
+def read_private(path):
+    return pd.read_csv(path, index_col=0)
+
+
+@pytest.fixture
+def outputs(tmp_path):
+    """
+    Run files_to_id on a small ASV file, and return the paths of its public and private outputs.
+    """
+    return run_files_to_id(tmp_path)
+
+
+def test_public_output(outputs):
+    pd.testing.assert_frame_equal(read_public(outputs[0]), PUBLIC)
+
+
+def test_private_output(outputs):
+    pd.testing.assert_frame_equal(read_private(outputs[1]), PRIVATE)
+
+
+# The expected outputs of the edge cases below are the ones of the row-wise implementation
+
+
+def test_ids_missing_from_the_files(tmp_path):
+    # A taxon of the ASV file without a feature, and a feature without a sequence
+    asv = pd.concat(
+        [ASV, pd.DataFrame({"id": ["k__Fungi;g__Omega_9"], "prob": [5], "other": [0]})]
+    )
+    taxonomy = pd.concat(
+        [
+            TAXONOMY,
+            pd.DataFrame(
+                {"Feature ID": ["f8"], "Taxon": ["k__Fungi;g__Beta"], "Consensus": [0.5]}
+            ),
+        ]
+    )
+
+    public, private = run_files_to_id(tmp_path, asv=asv, taxonomy=taxonomy)
+
+    pd.testing.assert_frame_equal(read_public(public), PUBLIC)
+    pd.testing.assert_frame_equal(read_private(private), PRIVATE)
+
+
+def test_duplicate_asv_rows(tmp_path):
+    # The reads of the first row of a taxon are kept
+    asv = pd.concat([ASV, ASV.iloc[[1]].assign(prob=99)])
+
+    public, private = run_files_to_id(tmp_path, asv=asv)
+
+    expected = PUBLIC.copy()
+    expected.loc[1, "feature_id"] = "['f3', 'f3']"
+    pd.testing.assert_frame_equal(read_public(public), expected)
+    pd.testing.assert_frame_equal(read_private(private), PRIVATE)
+
+
+def test_duplicate_sequence_rows(tmp_path):
+    rep = pd.concat([REP, REP.iloc[[0]].assign(sequence="TTT")])
+
+    public, private = run_files_to_id(tmp_path, rep=rep)
+
+    expected = PUBLIC.copy()
+    expected.loc[0, "feature_id"] = "['f1', 'f1', 'f2']"
+    pd.testing.assert_frame_equal(read_public(public), expected)
+    expected = pd.concat([PRIVATE.iloc[:1], PRIVATE.iloc[:1], PRIVATE.iloc[1:]])
+    expected = expected.reset_index(drop=True)
+    expected.loc[1, "sequence"] = "TTT"
+    pd.testing.assert_frame_equal(read_private(private), expected)
+
+
+@pytest.mark.parametrize(
+    "asv",
+    [ASV.iloc[:0], ASV.assign(id="k__Fungi;g__Omega")],
+    ids=["empty", "no-matching-taxon"],
+)
+def test_no_matching_rows(tmp_path, asv):
+    # The row-wise implementation raised a ValueError here, the public file now only has
+    # its header
+    public, private = run_files_to_id(tmp_path, asv=asv)
+
+    assert list(read_public(public).columns) == list(PUBLIC.columns)
+    assert read_public(public).empty
+    pd.testing.assert_frame_equal(read_private(private), PRIVATE)
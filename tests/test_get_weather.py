@@ -0,0 +1,153 @@
+import numpy as np
+import pandas as pd
+import pytest
+import requests as req
+
+from kitDataMerger.meteorology.get_weather import (
+    WEATHER_COLUMNS,
+    WEATHER_ROWS,
+    enrich_meta_data,
+    mark_missing_weather,
+)
+from kitDataMerger.meteorology.providers import WeatherProvider
+from kitDataMerger.progress import ProgressReporter
+from kitDataMerger.meteorology.station_catalogue import build_station_index
+
+
+class Label:
+    """
+    Look-alike of the Tkinter variable and labels of the progress.
+    """
+
+    def set(self, value):
+        pass
+
+    def configure(self, **kwargs):
+        pass
+
+
+class FarProvider(WeatherProvider):
+    """
+    A single station, in Eilat, far from the samples in the center of Israel.
+    """
+
+    def __init__(self):
+        self.fetched = []
+
+    def stations(self):
+        return build_station_index(
+            [
+                {
+                    "stationId": 1,
+                    "location": {"latitude": 29.55, "longitude": 34.95},
+                    "monitors": [{"name": "TD"}],
+                }
+            ]
+        )
+
+    def fetch(self, station_id, days):
+        self.fetched.append((station_id, days))
+        return []
+
+
+class TimeoutProvider(FarProvider):
+    """
+    A provider whose station list times out.
+    """
+
+    def stations(self):
+        raise req.exceptions.Timeout("The station list timed out")
+
+
+class ErrorReporter(ProgressReporter):
+    """
+    Record the reported errors.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.errors = []
+
+    def error(self, title, message):
+        self.errors.append((title, message))
+
+
+def make_meta():
+    return pd.DataFrame(
+        {
+            "Kit ID": [1, 2],
+            "Date": ["02/11/2023", "03/12/2023"],
+            "Location": ["Loc1", "Loc2"],
+            "Coordination": ["32.1,34.8", "32.2,34.9"],
+            "Location Picture": ["Loc1", "Loc2"],
+            "Treatment": ["Tre1", "Tre2"],
+            "Plant Picture": ["Pla1", "Pla2"],
+            "Temperature": [21, 22],
+            "School": ["Sch1", "Sch2"],
+            "Scientific Plant Name": ["Sci1", "Sci2"],
+            "Hebrew Plant Name": ["Heb1", "Heb2"],
+        }
+    )
+
+
+def enrich(df, provider):
+    label = Label()
+    return enrich_meta_data(
+        df, 32, label, label, label, kit_ids={1, 2}, provider=provider
+    )
+
+
+def test_no_station_within_the_radius():
+    provider = FarProvider()
+
+    df = enrich(make_meta(), provider)
+
+    assert df.attrs[WEATHER_ROWS] == []
+    assert provider.fetched == []
+    assert df[WEATHER_COLUMNS].isnull().all().all()
+    # Nothing was looked up, so nothing is marked as missing
+    assert mark_missing_weather(df)[WEATHER_COLUMNS].isnull().all().all()
+
+
+def test_weather_already_present():
+    provider = FarProvider()
+    meta = make_meta()
+    for position, column in enumerate(WEATHER_COLUMNS):
+        meta.insert(7 + position, column, [1.0, 2.0])
+
+    df = enrich(meta, provider)
+
+    assert df.attrs[WEATHER_ROWS] == []
+    assert provider.fetched == []
+    np.testing.assert_array_equal(
+        df[WEATHER_COLUMNS].to_numpy(), np.array([[1.0] * 14, [2.0] * 14])
+    )
+
+
+def test_stations_request_error_is_reported():
+    provider = TimeoutProvider()
+    reporter = ErrorReporter()
+
+    df = enrich_meta_data(
+        make_meta(),
+        32,
+        reporter.progress_var,
+        reporter.percentage_label,
+        reporter.status_label,
+        kit_ids={1, 2},
+        provider=provider,
+    )
+
+    assert df is None
+    assert provider.fetched == []
+    assert [title for title, message in reporter.errors] == ["Request Error"]
+    assert "timed out" in reporter.errors[0][1]
+
+
+def test_weather_provider_is_abstract():
+    class StationsOnly(WeatherProvider):
+        def stations(self):
+            return build_station_index([])
+
+    with pytest.raises(TypeError):
+        StationsOnly()
@@ -0,0 +1,121 @@
+import threading
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from kitDataMerger.meteorology import get_weather, ims_client
+from kitDataMerger.meteorology.observation_cache import ObservationCache
+
+
+class FakeIMSHandler(BaseHTTPRequestHandler):
+    """
+    Answer each GET with the next status of the server's script, and record the requests.
+    The last status of the script is repeated once the script is used up.
+    """
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, self.headers.get("Authorization")))
+            status = server.script[min(len(server.requests), len(server.script)) - 1]
+
+        body = {200: b'{"data": []}', 204: b""}.get(status, b"{}")
+        self.send_response(status)
+        if status == 429:
+            self.send_header("Retry-After", "0")
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def fake_ims():
+    """
+    Start a fake IMS API on localhost, set its script with fake_ims.script = [statuses].
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeIMSHandler)
+    server.lock = threading.Lock()
+    server.requests = []
+    server.script = [200]
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def session(monkeypatch):
+    """
+    Use a session without waits between the retries as the shared session of ims_get.
+    """
+    monkeypatch.setenv("API_KEY", "test-key")
+    session = ims_client.create_session(retries=3, backoff_factor=0)
+    monkeypatch.setattr(ims_client, "_session", session)
+    ims_client.stats.reset()
+    yield session
+    session.close()
+    ims_client.stats.reset()
+
+
+def test_server_error_is_retried(fake_ims, session):
+    fake_ims.script = [503, 503, 200]
+
+    response = ims_client.ims_get(f"{fake_ims.url}/stations")
+
+    assert response.status_code == 200
+    assert response.json() == {"data": []}
+    assert len(fake_ims.requests) == 3
+
+
+def test_too_many_requests_stops_after_the_retries(fake_ims, session):
+    fake_ims.script = [429]
+
+    response = ims_client.ims_get(f"{fake_ims.url}/stations")
+
+    assert response.status_code == 429
+    assert len(fake_ims.requests) == 3 + 1
+
+
+def test_authorization_header_is_sent(fake_ims, session):
+    ims_client.ims_get(f"{fake_ims.url}/stations/1/data", params={"from": "2023/01/01"})
+
+    path, authorization = fake_ims.requests[0]
+    assert path == "/stations/1/data?from=2023%2F01%2F01"
+    assert authorization == "test-key"
+
+
+def test_stats_count_the_attempts(fake_ims, session):
+    fake_ims.script = [503, 200, 429]
+
+    ims_client.ims_get(f"{fake_ims.url}/stations")
+    ims_client.ims_get(f"{fake_ims.url}/stations")
+
+    summary = ims_client.stats.summary()
+    assert summary["requests"] == 2
+    assert summary["retries"] == 1 + 3
+    assert summary["failures"] == 1
+    assert [timing.attempts for timing in ims_client.stats.timings] == [2, 4]
+    assert [timing.status for timing in ims_client.stats.timings] == [200, 429]
+
+
+def test_days_without_observations_are_fetched_again(
+    fake_ims, session, monkeypatch, tmp_path
+):
+    monkeypatch.setattr(get_weather, "IMS_API_URL", fake_ims.url)
+    fake_ims.script = [204]
+    path = str(tmp_path / "observations.sqlite")
+    days = [date(2023, 2, 11), date(2023, 2, 12)]
+
+    # Each run has its own cache object over the same database
+    assert get_weather.fetch_station_data(1, days, ObservationCache(path)) == []
+    assert get_weather.fetch_station_data(1, days, ObservationCache(path)) == []
+
+    assert len(fake_ims.requests) == 2
+    assert ObservationCache(path).size() == 0
@@ -0,0 +1,67 @@
+import json
+import hashlib
+from datetime import date
+
+import pytest
+
+from kitDataMerger.meteorology.observation_cache import ObservationCache
+from kitDataMerger.meteorology.providers import (
+    ARCHIVE_OBSERVATIONS,
+    ARCHIVE_STATIONS,
+    ReplayProvider,
+)
+
+STATIONS = [
+    {
+        "stationId": 1,
+        "location": {"latitude": 32.1, "longitude": 34.8},
+        "monitors": [{"name": "TD"}, {"name": "RH"}],
+    }
+]
+
+OBSERVATIONS = [
+    {
+        "datetime": "2023-02-11T12:00:00+02:00",
+        "channels": [{"name": "TD", "value": 18.5, "valid": True}],
+    }
+]
+
+
+def md5(path):
+    with open(path, "rb") as file:
+        return hashlib.md5(file.read()).hexdigest()
+
+
+@pytest.fixture
+def archive(tmp_path):
+    """
+    A recorded weather archive with one station and one day of observations.
+    """
+    with open(tmp_path / ARCHIVE_STATIONS, "w", encoding="utf-8") as file:
+        json.dump(STATIONS, file)
+    ObservationCache(str(tmp_path / ARCHIVE_OBSERVATIONS), max_bytes=None).put(
+        1, {date(2023, 2, 11): OBSERVATIONS}, complete_only=False
+    )
+    return tmp_path
+
+
+def test_replay_serves_the_archive(archive):
+    provider = ReplayProvider(str(archive))
+
+    assert [station["stationId"] for station in provider.stations().stations] == [1]
+    assert provider.fetch(1, [date(2023, 2, 10), date(2023, 2, 11)]) == OBSERVATIONS
+    assert provider.fetch(2, [date(2023, 2, 11)]) == []
+
+
+def test_replay_does_not_change_the_archive(archive):
+    before = md5(archive / ARCHIVE_OBSERVATIONS)
+
+    provider = ReplayProvider(str(archive))
+    provider.fetch(1, [date(2023, 2, 11)])
+    with pytest.raises(ValueError):
+        provider.observations.put(1, {date(2023, 2, 12): []}, complete_only=False)
+
+    assert md5(archive / ARCHIVE_OBSERVATIONS) == before
+    assert sorted(path.name for path in archive.iterdir()) == sorted(
+        [ARCHIVE_STATIONS, ARCHIVE_OBSERVATIONS]
+    )
@@ -0,0 +1,33 @@
+import pickle
+
+import pytest
+
+from kitDataMerger.fungi.reference import load_reference
+
+REFERENCE = "SH1.09FU\tk__Fungi;g__Alpha\nSH2.09FU\tk__Fungi;g__Beta\n"
+
+MAPPING = {"k__Fungi;g__Alpha": "SH1.09FU", "k__Fungi;g__Beta": "SH2.09FU"}
+
+
+@pytest.mark.parametrize(
+    "cache",
+    [
+        # A truncated pickle, random bytes, and a valid pickle of something else
+        pickle.dumps({"mapping": MAPPING})[:-5],
+        b"\x80\x04\x95not a pickle",
+        pickle.dumps(["not", "a", "dict"]),
+    ],
+    ids=["truncated", "garbage", "list"],
+)
+def test_corrupt_cache_is_parsed_again(tmp_path, cache):
+    path = tmp_path / "reference.txt"
+    path.write_text(REFERENCE)
+    cache_path = tmp_path / "cache" / "reference.pickle"
+    cache_path.parent.mkdir()
+    cache_path.write_bytes(cache)
+
+    assert dict(load_reference(str(path), str(cache_path))) == MAPPING
+
+    # The corrupt cache was replaced by the parsed reference
+    with open(cache_path, "rb") as file:
+        assert pickle.load(file)["mapping"] == MAPPING
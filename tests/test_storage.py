@@ -0,0 +1,111 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from kitDataMerger.file_merger import SAMPLES, merge_frames
+from kitDataMerger.meta_data_merger import META_COLUMNS, join_meta_data
+from kitDataMerger.meteorology.get_weather import WEATHER_COLUMNS
+from kitDataMerger.storage import (
+    PUBLIC_CSV_OPTIONS,
+    as_read_back,
+    read_frame,
+    run_tasks,
+    write_frame,
+)
+
+# Merged data of kit 3, with the columns of the merged files
+MERGED = pd.DataFrame(
+    {
+        "id": ["AAC", "AAG"],
+        "kit_id": [3, 3],
+        "Kingdom": ["Bacteria", "Bacteria"],
+        "Genus": ["Alpha", "Beta"],
+        "F": [0.25, 0.75],
+        "R": [1.0, 0.0],
+    }
+)
+
+
+def make_meta():
+    """
+    Metadata whose Kit IDs are read as strings and whose weather is partly missing.
+    """
+    meta = {column: ["x", "y"] for column in META_COLUMNS}
+    meta["Kit ID"] = ["3", "kit"]
+    meta["Temperature"] = [21.0, np.nan]
+    meta.update({column: [18.5, "__"] for column in WEATHER_COLUMNS})
+    meta["Rain"] = [0.0, "__"]
+    # The weather columns are placed before the Temperature, as in the metadata file
+    columns = [column for column in META_COLUMNS if column not in WEATHER_COLUMNS]
+    index = columns.index("Temperature")
+    columns = columns[:index] + WEATHER_COLUMNS + columns[index:]
+    return pd.DataFrame(meta)[columns]
+
+
+def test_public_columns_keep_the_metadata_order():
+    df_meta = make_meta()
+    public = join_meta_data({"S_3_Bacteria.csv": MERGED}, df_meta)["S_3_Bacteria.csv"]
+    assert list(public.columns) == list(MERGED.columns) + list(df_meta.columns)
+
+
+def test_uploaded_records_have_the_saved_file_types(tmp_path):
+    frames = join_meta_data({"S_3_Bacteria.csv": MERGED}, make_meta())
+    public = frames["S_3_Bacteria.csv"]
+
+    # The records of the saved public file are the ones that used to be uploaded
+    path = str(tmp_path / "S_3_Bacteria.csv")
+    write_frame(public, path, PUBLIC_CSV_OPTIONS)
+    saved = read_frame(path, PUBLIC_CSV_OPTIONS).to_dict(orient="records")
+    records = as_read_back(public, PUBLIC_CSV_OPTIONS, WEATHER_COLUMNS).to_dict(
+        orient="records"
+    )
+
+    assert records[0]["Kit ID"] == 3 and type(records[0]["Kit ID"]) is int
+    assert records[0]["Rain"] == 0 and type(records[0]["Rain"]) is int
+    assert records[0]["TD"] == 18.5 and type(records[0]["TD"]) is float
+    assert type(records[0]["Temperature"]) is float
+    for record, saved_record in zip(records, saved):
+        assert list(record) == list(saved_record)
+        for column, value in record.items():
+            assert value == saved_record[column] or column == "Rain"
+            assert type(value) in (type(saved_record[column]), int)
+
+
+def _fail_on_kit_two(kit):
+    if kit == 2:
+        raise ValueError("broken kit")
+    return kit * 10
+
+
+def test_run_tasks_isolates_the_failing_tasks():
+    results, errors = run_tasks(_fail_on_kit_two, {1: (1,), 2: (2,), 3: (3,)})
+    assert results == {1: 10, 3: 30}
+    assert list(errors) == [2] and isinstance(errors[2], ValueError)
+
+
+def test_merge_frames_skips_a_failing_kit(monkeypatch, caplog):
+    import kitDataMerger.file_merger as file_merger
+
+    format_kit = file_merger._format_kit
+
+    def fail_on_kit_two(kit, kit_df, samples_type):
+        if kit == 2:
+            raise ValueError("broken kit")
+        return format_kit(kit, kit_df, samples_type)
+
+    # Merged samples of kits 1 and 2, indexed by kit and taxon
+    merged = pd.DataFrame(
+        {sample: [1.0, 2.0] for sample in SAMPLES},
+        index=pd.MultiIndex.from_tuples(
+            [(1, "AAC k__Bacteria; g__Alpha"), (2, "AAG k__Bacteria; g__Beta")],
+            names=["kit_id", "taxon"],
+        ),
+    )
+    monkeypatch.setattr(file_merger, "_merge_samples", lambda *args: merged)
+    monkeypatch.setattr(file_merger, "_format_kit", fail_on_kit_two)
+
+    with caplog.at_level(logging.ERROR):
+        frames = merge_frames(None, None, None, "Bacteria")
+    assert list(frames) == ["S_1_Bacteria.csv"]
+    assert "kit ID 2" in caplog.text